@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from mercuryITC import INVALID, Reading
+from scheduler import PollScheduler
+from typing import NamedTuple
+import arbiter
+import threading
+import time
+import traceback
+
+
+class Sample(NamedTuple):
+    """
+    Reading of one device signal published on the bus
+
+    Attributes:
+        device: device ID, e.g. MB1
+        signal: signal name, e.g. TEMP, or RATIO for the heater power ratio
+        reading: parsed reading
+        timestamp: monotonic time the reading was taken
+    """
+    device: str
+    signal: str
+    reading: Reading
+    timestamp: float
+
+    @property
+    def channel(self) -> str:
+        return "%s:%s" % (self.device, self.signal)
+
+
+class Subscription:
+    """
+    Subscriber of the reading bus with its own channel filter and rate
+
+    Attributes:
+        callback: called with every Sample delivered to the subscriber
+        channels: channels ("MB1:TEMP") or devices ("MB1") to receive, all if None
+        period: minimum time between two samples of one channel (s)
+        batch: call back once per published batch with a list of samples
+    """
+
+    # fraction of the period a sample may arrive early, absorbs polling jitter
+    SLACK = 0.1
+
+    def __init__(self, callback, channels=None, period: float = 0.0, batch: bool = False):
+        self.callback = callback
+        self.channels = None if channels is None else set(channels)
+        self.period = period
+        self.batch = batch
+        self._sent = {}
+
+    def wants(self, sample: Sample) -> bool:
+        """
+        Decides whether a sample passes the filter and the rate limit
+
+        Args:
+            sample: published sample
+        Returns:
+            True if the sample is delivered to the subscriber
+        """
+        channel = sample.channel
+        if self.channels is not None and channel not in self.channels and sample.device not in self.channels:
+            return False
+        last = self._sent.get(channel)
+        if last is not None and sample.timestamp - last < (1.0 - self.SLACK) * self.period:
+            return False
+        self._sent[channel] = sample.timestamp
+        return True
+
+
+class ReadingBus:
+    """
+    Publish/subscribe bus between the acquisition core and its consumers, e.g.
+    GUI pages, the history and loggers. Readings are taken once and fanned out
+    to every subscriber, so adding a viewer costs no instrument traffic.
+
+    Samples are published in batches, one per acquisition cycle, so consumers
+    such as the GUI can apply a whole cycle at once. Callbacks run on the
+    publishing thread and must be quick; GUI subscribers hand samples over to
+    their own thread, e.g. through a Qt signal.
+    """
+
+    def __init__(self):
+        self._subscriptions = []
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, channels=None, period: float = 0.0, replay: bool = True,
+                  batch: bool = False) -> Subscription:
+        """
+        Adds a subscriber
+
+        Args:
+            callback: called with every Sample delivered to the subscriber
+            channels: channels ("MB1:TEMP") or devices ("MB1") to receive, all if None
+            period: minimum time between two samples of one channel (s)
+            replay: deliver the newest sample of each matching channel right away
+            batch: call back once per published batch with a list of samples
+        Returns:
+            subscription, needed to unsubscribe
+        """
+        subscription = Subscription(callback, channels, period, batch)
+        with self._lock:
+            self._subscriptions.append(subscription)
+            latest = list(self._latest.values()) if replay else []
+        if latest:
+            self._deliver(subscription, latest)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Removes a subscriber
+
+        Args:
+            subscription: subscription returned by subscribe()
+        """
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def publish(self, samples: list) -> None:
+        """
+        Delivers a batch of samples to every subscriber that wants them
+
+        Args:
+            samples: new samples, e.g. all readings of one acquisition cycle
+        """
+        with self._lock:
+            for sample in samples:
+                self._latest[sample.channel] = sample
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            self._deliver(subscription, samples)
+
+    def latest(self, channel: str) -> Sample:
+        """
+        Newest sample of a channel
+
+        Args:
+            channel: channel name, e.g. MB1:TEMP
+        Returns:
+            newest sample, None if the channel was never published
+        """
+        with self._lock:
+            return self._latest.get(channel)
+
+    def snapshot(self) -> dict:
+        """
+        Newest sample of every channel
+
+        Returns:
+            samples keyed by channel
+        """
+        with self._lock:
+            return dict(self._latest)
+
+    def _deliver(self, subscription: Subscription, samples: list) -> None:
+        wanted = [sample for sample in samples if subscription.wants(sample)]
+        try:
+            if subscription.batch:
+                if wanted:
+                    subscription.callback(wanted)
+            else:
+                for sample in wanted:
+                    subscription.callback(sample)
+        except Exception:
+            # a faulty subscriber must not stop acquisition for the others
+            traceback.print_exc()
+
+
+class AcquisitionCore(threading.Thread):
+    """
+    Single polling loop for the whole application. Consumers request the signals
+    they need at the period they need; every signal is polled once at the
+    shortest period requested for its device, and the readings are published on
+    a ReadingBus. The heater power ratio of polled VOLT signals is derived from
+    the cached max voltage and published as the RATIO signal.
+
+    Attributes:
+        tc: temperature controller, usually an ArbiterProxy
+        bus: bus the readings are published on
+        scheduler: deadline scheduler of the polled devices
+        signals: signals polled per device
+    """
+
+    def __init__(self, tc, bus: ReadingBus, scheduler: PollScheduler = None):
+        threading.Thread.__init__(self, name="AcquisitionCore", daemon=True)
+        self.tc = tc
+        self.bus = bus
+        self.scheduler = scheduler or PollScheduler()
+        self.signals = {}
+        self._requests = {}
+        self._priorities = {}
+        self._lock = threading.Lock()
+        self._running = True
+
+    def request(self, owner: str, device: str, signals: list, period: float, priority: int = 0) -> None:
+        """
+        Asks for signals of a device to be polled
+
+        Args:
+            owner: name of the consumer, e.g. panel or heater
+            device: device ID
+            signals: signal names, e.g. ["VOLT"]
+            period: time between readings (s)
+            priority: 0 for primary devices, higher values are read later
+        """
+        with self._lock:
+            self._requests[(owner, device)] = (set(signals), period, priority)
+            self._reschedule(device)
+
+    def release(self, owner: str, device: str = None) -> None:
+        """
+        Withdraws requests, polling stops once nobody needs a signal
+
+        Args:
+            owner: name of the consumer
+            device: device ID, every device of the owner if None
+        """
+        with self._lock:
+            for key in [key for key in self._requests if key[0] == owner and device in (None, key[1])]:
+                del self._requests[key]
+                self._reschedule(key[1])
+
+    def _reschedule(self, device: str) -> None:
+        requests = [request for (owner, name), request in self._requests.items() if name == device]
+        if not requests:
+            self.signals.pop(device, None)
+            self._priorities.pop(device, None)
+            self.scheduler.remove(device)
+            return
+        signals = set().union(*(signals for signals, period, priority in requests))
+        period = min(period for signals, period, priority in requests)
+        priority = min(priority for signals, period, priority in requests)
+        if self.signals.get(device) == signals and self._priorities.get(device) == priority:
+            # only the period changed, the next deadline and any boost are kept
+            self.scheduler.set_period(device, period)
+        else:
+            self.scheduler.add(device, period, priority)
+        self.signals[device] = signals
+        self._priorities[device] = priority
+
+    def boost(self, device: str, period: float, duration: float) -> None:
+        """
+        Temporarily polls a device faster, e.g. the gas flow after a flow write
+
+        Args:
+            device: device ID
+            period: boosted time between readings (s)
+            duration: time the boost lasts (s)
+        """
+        self.scheduler.boost(device, period, duration)
+
+    def stop(self) -> None:
+        """
+        Ends the polling loop
+
+        """
+        self._running = False
+        self.scheduler.wake()
+
+    def run(self) -> None:
+        while self._running:
+            # sleeps until the next deadline, then reads every device due by then
+            due = self.scheduler.wait(lambda: self._running)
+            if due:
+                self.poll(due)
+
+    def poll(self, devices: list) -> None:
+        """
+        Reads devices and publishes their readings as one batch, primary devices
+        in one round trip and the others in a second one queued behind them
+
+        Args:
+            devices: device IDs
+        """
+        with self._lock:
+            groups = {}
+            for device in devices:
+                if device in self.signals:
+                    route = arbiter.PRIMARY if self._priority(device) == 0 else arbiter.SECONDARY
+                    groups.setdefault(route, {})[device] = sorted(self.signals[device])
+        samples = []
+        for route in sorted(groups):
+            try:
+                tc = self.tc.at(route) if hasattr(self.tc, "at") else self.tc
+                readings = tc.get_many(groups[route])
+            except Exception:
+                # keep polling through I/O errors, the readings are marked invalid
+                readings = {device: {signal: INVALID for signal in signals}
+                            for device, signals in groups[route].items()}
+            now = time.monotonic()
+            for device, signals in readings.items():
+                for signal, reading in signals.items():
+                    samples.append(Sample(device, signal, reading, now))
+                    if signal == "VOLT":
+                        samples.append(Sample(device, "RATIO", self.power_ratio(device, reading), now))
+        # one batch per cycle, consumers apply a whole cycle at once
+        self.bus.publish(samples)
+
+    def _priority(self, device: str) -> int:
+        return min(priority for (owner, name), (signals, period, priority) in self._requests.items() if name == device)
+
+    def power_ratio(self, device: str, voltage: Reading) -> Reading:
+        """
+        Heater power as a percentage of the maximum, from the heater voltage
+
+        Args:
+            device: heater device ID
+            voltage: heater voltage reading
+        Returns:
+            power ratio reading (%), INVALID if it cannot be computed
+        """
+        try:
+            # the max voltage is a cached setting, this costs no instrument traffic
+            limit = float(self.tc.get_max_voltage(device)[device])
+            ratio = 100.0 * (voltage.value / limit) ** 2
+        except Exception:
+            return INVALID
+        return Reading(ratio, "%", "%.1f%%" % ratio)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from concurrent.futures import Future
+import itertools
+import queue
+import threading
+
+
+# request priorities, lower values are served first
+WRITE = 0
+PRIMARY = 1
+SECONDARY = 2
+HEATER = 3
+PID = 4
+
+
+class InstrumentArbiter(threading.Thread):
+    """
+    Single I/O thread that owns a TemperatureController exclusively. Every caller
+    submits its request to a priority queue and gets a future back, so requests
+    never interleave on the wire and user writes overtake queued polling reads.
+
+    Attributes:
+        tc: temperature controller driven by this thread
+        served: number of requests served per priority
+    """
+
+    def __init__(self, tc):
+        threading.Thread.__init__(self, name="InstrumentArbiter", daemon=True)
+        self.tc = tc
+        self.served = {}
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._running = True
+        # a request is either queued before the stop sentinel or rejected
+        self._lock = threading.Lock()
+
+    def submit(self, priority: int, method, *args, **kwargs) -> Future:
+        """
+        Queues a call for the I/O thread
+
+        Args:
+            priority: WRITE, PRIMARY, SECONDARY, HEATER or PID
+            method: callable to run on the I/O thread
+        Returns:
+            future completed with the return value of the call
+        """
+        future = Future()
+        with self._lock:
+            if self._running:
+                # the counter keeps requests of equal priority in FIFO order
+                self._queue.put((priority, next(self._order), future, method, args, kwargs))
+                return future
+        future.set_exception(RuntimeError("instrument arbiter stopped"))
+        return future
+
+    def call(self, priority: int, method, *args, **kwargs):
+        """
+        Queues a call for the I/O thread and waits for its result
+
+        Args:
+            priority: WRITE, PRIMARY, SECONDARY, HEATER or PID
+            method: callable to run on the I/O thread
+        Returns:
+            return value of the call
+        """
+        return self.submit(priority, method, *args, **kwargs).result()
+
+    def proxy(self, priority: int) -> "ArbiterProxy":
+        """
+        Gets a stand-in for the temperature controller whose calls run on the
+        I/O thread at the given priority
+
+        Args:
+            priority: WRITE, PRIMARY, SECONDARY, HEATER or PID
+        Returns:
+            proxy with the TemperatureController interface
+        """
+        return ArbiterProxy(self, priority)
+
+    def stop(self, discard: bool = False) -> None:
+        """
+        Stops the I/O thread once the requests already queued are served
+
+        Args:
+            discard: fail the queued requests instead of serving them
+        """
+        discarded = []
+        with self._lock:
+            self._running = False
+            while discard:
+                try:
+                    discarded.append(self._queue.get_nowait()[2])
+                except queue.Empty:
+                    break
+            self._queue.put((float("inf"), next(self._order), None, None, (), {}))
+        # done callbacks may submit again, so the futures fail outside the lock
+        for future in discarded:
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError("instrument arbiter stopped"))
+
+    def run(self) -> None:
+        while True:
+            priority, order, future, method, args, kwargs = self._queue.get()
+            if future is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(method(*args, **kwargs))
+            except BaseException as error:
+                future.set_exception(error)
+            self.served[priority] = self.served.get(priority, 0) + 1
+
+
+class ArbiterProxy:
+    """
+    Routes TemperatureController calls through an InstrumentArbiter. Methods and
+    properties block the calling thread until the I/O thread has served them.
+
+    Attributes:
+        arbiter: arbiter serving the calls
+        priority: priority of every call made through this proxy
+    """
+
+    def __init__(self, arbiter: InstrumentArbiter, priority: int):
+        self.arbiter = arbiter
+        self.priority = priority
+
+    def at(self, priority: int) -> "ArbiterProxy":
+        """
+        Gets a proxy for the same arbiter at another priority
+
+        Args:
+            priority: WRITE, PRIMARY, SECONDARY, HEATER or PID
+        Returns:
+            proxy with the TemperatureController interface
+        """
+        return ArbiterProxy(self.arbiter, priority)
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """
+        Queues a TemperatureController method without waiting for it
+
+        Args:
+            method: name of the TemperatureController method
+        Returns:
+            future completed with the return value of the method
+        """
+        return self.arbiter.submit(self.priority, getattr(self.arbiter.tc, method), *args, **kwargs)
+
+    def __getattr__(self, name):
+        tc = self.arbiter.tc
+        # properties such as devices and version talk to the instrument too
+        if isinstance(getattr(type(tc), name, None), property):
+            return self.arbiter.call(self.priority, getattr, tc, name)
+        attr = getattr(tc, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self.arbiter.call(self.priority, attr, *args, **kwargs)
+
+        return call
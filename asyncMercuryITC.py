@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from constants import DEVICES
+from mercuryITC import INVALID, MalformedResponse, Reading, TemperatureController, check_frame, parse_catalog, \
+    parse_response, parse_signals
+import asyncio
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+
+class AsyncTemperatureController:
+    """
+    asyncio counterpart of mercuryITC.TemperatureController. Getters and setters
+    are coroutines with the same names and arguments, so several instruments and
+    a data pipeline can share one event loop without a thread per device.
+
+    Transactions on one instrument are serialized with a lock. Every call takes
+    an optional timeout; a response that arrives after its call timed out or was
+    cancelled is discarded before the next transaction.
+
+    Attributes:
+        reader: asyncio stream the responses are read from
+        writer: asyncio stream the commands are written to
+        timeout: default timeout of a transaction (s)
+    """
+
+    TERMINATION = TemperatureController.TERMINATION
+    BAUDRATE = 9600
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float = 2.0):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.ratio = 0.0
+        self.max_voltage = {}
+        self.prev_value = {}
+        self._lock = asyncio.Lock()
+        # responses still owed by the instrument for timed out or cancelled calls
+        self._orphans = 0
+
+    @classmethod
+    async def open(cls, resource: str, timeout: float = 2.0, baudrate: int = BAUDRATE) -> "AsyncTemperatureController":
+        """
+        Opens a TCP or serial connection to the instrument
+
+        Args:
+            resource: TCPIP::<host>::<port>::SOCKET, ASRL<n>::INSTR or a serial port name
+            timeout: default timeout of a transaction (s)
+            baudrate: serial baud rate
+        Returns:
+            connected controller
+        """
+        if resource.startswith("TCPIP"):
+            host, port = resource.split("::")[1:3]
+            connection = asyncio.open_connection(host, int(port))
+        else:
+            if serial_asyncio is None:
+                raise ImportError("serial connections need the pyserial-asyncio package")
+            port = resource
+            if resource.startswith("ASRL"):
+                port = resource[len("ASRL"):].split("::")[0]
+                port = "COM%s" % port if port.isdigit() else port
+            connection = serial_asyncio.open_serial_connection(url=port, baudrate=baudrate)
+        reader, writer = await asyncio.wait_for(connection, timeout)
+        return cls(reader, writer, timeout)
+
+    async def close(self) -> None:
+        """
+        Closes the connection
+
+        """
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def version(self, timeout: float = None) -> str:
+        """
+        Get the name of connected device
+
+        Returns:
+            iTC version information
+        """
+        return await self.read(*TemperatureController._version, timeout=timeout)
+
+    async def devices(self, timeout: float = None) -> list:
+        """
+        Get the devices listed on the front panel of the iTC
+
+        Returns:
+            A list of existing hardware devices, e.g. ["DEV:MB1.T1:TEMP"]
+        """
+        raw, = await self.exchange(["READ:%s" % TemperatureController._devices], timeout)
+        return parse_catalog(raw)
+
+    async def exchange(self, values: list, timeout: float = None) -> list:
+        """
+        write several string operations to device and read back all raw responses
+        in one round trip
+
+        Args:
+            values: read or set values to device
+            timeout: timeout of the whole exchange (s), default timeout if None
+        Returns:
+            unmodified bytes sent back by the device, in order
+        """
+        async with self._lock:
+            # responses are only owed once the commands were handed to the transport
+            owed = 0
+            responses = []
+
+            async def transaction():
+                nonlocal owed
+                self.writer.write("".join("%s%s" % (value, self.TERMINATION) for value in values).encode("ascii"))
+                owed = len(values)
+                await self.writer.drain()
+                while self._orphans:
+                    await self.reader.readline()
+                    self._orphans -= 1
+                while owed:
+                    line = await self.reader.readline()
+                    owed -= 1
+                    # readline returns a partial line when the connection closes
+                    responses.append(check_frame(line))
+
+            try:
+                await asyncio.wait_for(transaction(), self.timeout if timeout is None else timeout)
+            finally:
+                self._orphans += owed
+            return responses
+
+    async def read_reading(self, value: str, prefix: str = "READ:", timeout: float = None) -> Reading:
+        """
+        Reads a typed value from device or interface
+
+        Args:
+            value: device ID, device command, and option (DEV:UID:command:option)
+            prefix: read command prefix
+            timeout: timeout of the call (s), default timeout if None
+        Returns:
+            typed reading of the response
+        """
+        if prefix == "READ:":
+            echo = value.encode("ascii")
+        elif prefix == "SET:":
+            echo = (prefix + value.rsplit(":", 1)[0]).encode("ascii")
+        else:
+            echo = None
+        response = (await self.exchange(["%s%s" % (prefix, value)], timeout))[0]
+        return parse_response(response, echo)
+
+    async def read(self, value: str, prefix: str = "READ:", timeout: float = None) -> str:
+        """
+        Reads data from device or interface
+
+        Args:
+            value: device ID, device command, and option (DEV:UID:command:option)
+            prefix: read command prefix
+            timeout: timeout of the call (s), default timeout if None
+        Returns:
+            data read, return value of the libary call
+        """
+        return (await self.read_reading(value, prefix, timeout)).text
+
+    async def set(self, value: str, prefix: str = "SET:", timeout: float = None) -> str:
+        """
+        Query the device to set values
+
+        Args:
+            value: device ID, device command, and option (DEV:UID:command:option)
+            prefix: set command prefix
+            timeout: timeout of the call (s), default timeout if None
+        Returns:
+            data read, return value of the libary call
+        """
+        return await self.read(value, prefix, timeout)
+
+    # getters
+    async def get_signal(self, device: str, signal: str, timeout: float = None) -> list:
+        """
+        Get front panel data for each device: temperature, voltage, gas flow
+
+        Args:
+            device: device ID
+            signal: read command
+        Returns:
+            device and data read
+        """
+        try:
+            value = await self.read(TemperatureController._signal % (DEVICES[device], signal), timeout=timeout)
+            self.prev_value[device] = value
+            return [device, value]
+        except (asyncio.TimeoutError, ConnectionError, MalformedResponse):
+            return [device, self.prev_value.get(device, "INVALID")]
+
+    async def get_reading(self, device: str, signal: str, timeout: float = None) -> Reading:
+        """
+        Get one front panel signal as a typed reading
+
+        Args:
+            device: device ID
+            signal: read command
+        Returns:
+            typed reading, the previous one if the response could not be used
+            and INVALID if the exchange failed
+        """
+        return (await self.get_many({device: [signal]}, timeout))[device][signal]
+
+    async def get_signals(self, device: str, signals: list, timeout: float = None) -> dict:
+        """
+        Get several front panel signals of one device with a single READ command
+
+        Args:
+            device: device ID
+            signals: read commands
+        Returns:
+            typed reading of each signal
+        """
+        return (await self.get_many({device: signals}, timeout))[device]
+
+    async def get_many(self, signals: dict, timeout: float = None) -> dict:
+        """
+        Get front panel signals of several devices in one round trip
+
+        Args:
+            signals: read commands for each device ID
+        Returns:
+            typed reading of each device and signal, INVALID for every signal
+            when the exchange failed
+        """
+        devices = list(signals)
+        commands = [
+            "READ:" + DEVICES[device] + "".join(":SIG:%s" % signal for signal in signals[device])
+            for device in devices
+        ]
+        try:
+            responses = await self.exchange(commands, timeout)
+        except (asyncio.TimeoutError, ConnectionError, MalformedResponse):
+            # nothing was read, the previous readings would pass for fresh ones
+            return {device: dict.fromkeys(signals[device], INVALID) for device in devices}
+
+        values = {}
+        for device, response in zip(devices, responses):
+            try:
+                values[device] = parse_signals(response, DEVICES[device].encode("ascii"), signals[device])
+            except MalformedResponse:
+                values[device] = dict.fromkeys(signals[device])
+            for signal, value in values[device].items():
+                if value is None:
+                    values[device][signal] = self.prev_value.get((device, signal), INVALID)
+                else:
+                    self.prev_value[(device, signal)] = value
+        return values
+
+    async def get_max_voltage(self, device=None, timeout: float = None) -> dict:
+        """
+        Reads the max voltage data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and max voltage data read
+        """
+        if device:
+            value = await self.read(TemperatureController._voltage % (DEVICES[device],), timeout=timeout)
+            if value != "INVALID":
+                self.max_voltage[device] = value
+        return self.max_voltage
+
+    async def get_resistance(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the resistance data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and resistance data read
+        """
+        return [device, await self.read(TemperatureController._resistance % (DEVICES[device],), timeout=timeout)]
+
+    async def get_heat_power_ratio(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the current voltage and max voltage data from device to calcuate power ratio
+
+        Args:
+            device: device ID
+        Returns:
+            device and calculated power ratio
+        """
+        voltage = (await self.get_reading(device, "VOLT", timeout)).value
+        try:
+            self.ratio = 100.0 * (voltage / float(self.max_voltage[device])) ** 2
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            pass
+        return [device, self.ratio]
+
+    async def get_heater(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the heater percentage data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and heater percentage read
+        """
+        return ["Heat", await self.read(TemperatureController._heater % (device,), timeout=timeout)]
+
+    async def get_flow(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the flow percentage data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and flow percentage read
+        """
+        return ["Flow", await self.read(TemperatureController._flow % (device,), timeout=timeout)]
+
+    async def get_setpoint(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the set point data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and set point read
+        """
+        return ["Set Point", await self.read(TemperatureController._setpoint % (device,), timeout=timeout)]
+
+    async def get_p(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the P data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and P read
+        """
+        return ["P", await self.read(TemperatureController._p % (device,), timeout=timeout)]
+
+    async def get_i(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the I data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and I read
+        """
+        return ["I", await self.read(TemperatureController._i % (device,), timeout=timeout)]
+
+    async def get_d(self, device: str, timeout: float = None) -> list:
+        """
+        Reads the D data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and D read
+        """
+        return ["D", await self.read(TemperatureController._d % (device,), timeout=timeout)]
+
+    async def get_sweep_table(self, device: str, timeout: float = None) -> str:
+        """
+        Reads the sweep table data from device
+
+        Args:
+            device: device ID
+        Returns:
+            device and sweep table read
+        """
+        return await self.read(TemperatureController._sweep % (device,), timeout=timeout)
+
+    # setters
+    async def _set(self, template: str, value, device: str, timeout: float = None) -> str:
+        return await self.set((template + ":%s") % (device, value), timeout=timeout)
+
+    async def set_max_voltage(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Set the maximum voltage limit for the heater
+
+        Args:
+            value: max voltage value (0-40)
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._voltage, value, device, timeout)
+
+    async def set_resistance(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Set the heater resistance
+
+        Args:
+            value: resistance value (10-2000)
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._resistance, value, device, timeout)
+
+    async def set_heater(self, setting: str, device: str, timeout: float = None) -> str:
+        """
+        Set the heater percentage (in manual)
+
+        Args:
+            value: heater percentage (0-100)
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._heater, setting, device, timeout)
+
+    async def set_flow(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Set the flow percentage (manual flow)
+
+        Args:
+            value: flow value between (0-100)
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._flow, value, device, timeout)
+
+    async def set_setpoint(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Set the temperature set point
+
+        Args:
+            value: set point value (0-2000)
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._setpoint, value, device, timeout)
+
+    async def set_p(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Set the P value
+
+        Args:
+            value: P value
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._p, value, device, timeout)
+
+    async def set_i(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Set the I value
+
+        Args:
+            value: I value
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._i, value, device, timeout)
+
+    async def set_d(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Set the D value
+
+        Args:
+            value: D value
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._d, value, device, timeout)
+
+    async def set_flow_setting(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Enables/disabeles flow control
+
+        Args:
+            value: enable ON or OFF
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._flow_setting, value, device, timeout)
+
+    async def set_setpoint_setting(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Sets the sweep mode
+
+        Args:
+            value: enable ON or OFF
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._setpoint_setting, value, device, timeout)
+
+    async def set_pid_setting(self, value: str, device: str, timeout: float = None) -> str:
+        """
+        Enables/disables the PID (proportional-integral-derivative) control
+
+        Args:
+            value: enable ON or OFF
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._pid_setting, value, device, timeout)
+
+    async def set_sweep_table(self, table: list, device: str, timeout: float = None) -> str:
+        """
+        Sets file to read from the sweep table
+
+        Args:
+            value: sweep table list
+            device: device ID
+        Returns:
+            device and valid or invalid write
+        """
+        return await self._set(TemperatureController._sweep, table, device, timeout)
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput and latency benchmarks for the driver and the polling loops.
+
+Runs against the simulator by default, or against a real instrument with
+--resource. The write benchmarks write back the P the loop already has, so a
+real instrument keeps its settings. Results are written as JSON so that runs can be compared, e.g.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json
+"""
+
+
+from constants import COMMANDS, DEVICES, POLL_PERIODS, POLL_PRIORITIES, SENSORS
+import acquisition
+import arbiter
+import argparse
+import json
+import mercuryITC as itc
+import platform
+import simulator
+import sys
+import time
+
+
+def percentile(samples: list, q: float) -> float:
+    """
+    Nearest-rank percentile of a sorted list
+
+    Args:
+        samples: sorted samples
+        q: percentile (0-100)
+    Returns:
+        sample at the percentile
+    """
+    if not samples:
+        return 0.0
+    index = max(int(round(q / 100.0 * len(samples) + 0.5)) - 1, 0)
+    return samples[min(index, len(samples) - 1)]
+
+
+def measure(tc, name: str, call, iterations: int) -> dict:
+    """
+    Times repeated calls of one hot path
+
+    Args:
+        tc: temperature controller under test
+        name: benchmark name
+        call: callable running one iteration
+        iterations: number of timed iterations
+    Returns:
+        machine readable result of the benchmark
+    """
+    session = tc.session
+    before = (session.transactions, session.invalid, session.retries, session.reconnects, session.timeouts)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        begin = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    after = (session.transactions, session.invalid, session.retries, session.reconnects, session.timeouts)
+    latencies.sort()
+    return {
+        "name": name,
+        "iterations": iterations,
+        "seconds": elapsed,
+        "calls_per_second": iterations / elapsed if elapsed else 0.0,
+        "transactions_per_second": (after[0] - before[0]) / elapsed if elapsed else 0.0,
+        "p50_ms": 1000.0 * percentile(latencies, 50),
+        "p95_ms": 1000.0 * percentile(latencies, 95),
+        "p99_ms": 1000.0 * percentile(latencies, 99),
+        "transactions": after[0] - before[0],
+        "invalid": after[1] - before[1],
+        "retries": after[2] - before[2],
+        "reconnects": after[3] - before[3],
+        "timeouts": after[4] - before[4],
+        "gap_ms": 1000.0 * session.pacer.gap,
+    }
+
+
+def current_p(tc, device: str) -> str:
+    """
+    P of a loop, written back unchanged by the write benchmarks so that a real
+    instrument keeps its settings
+
+    Args:
+        tc: temperature controller under test
+        device: device of the loop
+    Returns:
+        P as read, None if it could not be read
+    """
+    p = tc.get_p(device)[1]
+    try:
+        float(p)
+    except (TypeError, ValueError):
+        return None
+    return p
+
+
+def driver_benchmarks(tc, iterations: int) -> list:
+    """
+    Benchmarks of the TemperatureController hot paths
+
+    Args:
+        tc: temperature controller under test
+        iterations: number of timed iterations per benchmark
+    Returns:
+        results of the driver benchmarks
+    """
+    temperature = DEVICES["MB1"]
+    tc.get_max_voltage("MB0")
+    p = current_p(tc, temperature)
+    if p is None:
+        write = {"name": "set", "skipped": "P of %s could not be read" % temperature}
+    else:
+        write = measure(tc, "set", lambda: tc.set_p(p, temperature), iterations)
+    return [
+        measure(tc, "read", lambda: tc.read(tc._signal % (temperature, "TEMP")), iterations),
+        write,
+        measure(tc, "get_signal", lambda: tc.get_signal("MB1", "TEMP"), iterations),
+        measure(tc, "get_many", lambda: tc.get_many({device: [COMMANDS[device]] for device in DEVICES}), iterations),
+        measure(tc, "get_heat_power_ratio", lambda: tc.get_heat_power_ratio("MB0"), iterations),
+    ]
+
+
+def thread_benchmarks(tc, iterations: int) -> list:
+    """
+    Benchmarks of the acquisition core and the controller.py writer thread,
+    served through the I/O arbiter as in the GUI. The writer benchmark is
+    skipped when PyQt5 is not installed.
+
+    Args:
+        tc: temperature controller under test
+        iterations: number of timed iterations per benchmark
+    Returns:
+        results of the thread benchmarks
+    """
+    io = arbiter.InstrumentArbiter(tc)
+    io.start()
+    try:
+        core = acquisition.AcquisitionCore(io.proxy(arbiter.PRIMARY), acquisition.ReadingBus())
+        for device, name in SENSORS.items():
+            core.request("benchmark", device, [COMMANDS[device]], POLL_PERIODS[name[1]], POLL_PRIORITIES[name[1]])
+        results = [measure(tc, "acquisition_poll", lambda: core.poll(list(SENSORS)), iterations)]
+
+        try:
+            import controller
+        except ImportError as error:
+            return results + [{"name": "writer_write", "skipped": str(error)}]
+
+        p = current_p(tc, DEVICES["MB1"])
+        if p is None:
+            return results + [{"name": "writer_write", "skipped": "P of %s could not be read" % DEVICES["MB1"]}]
+        writer = controller.writerThread()
+        writer.itc(io.proxy(arbiter.WRITE))
+        writer.connected(True)
+        return results + [
+            measure(tc, "writer_write",
+                    lambda: writer.queueWrite("set_p", DEVICES["MB1"], "P value", p).result(), iterations),
+        ]
+    finally:
+        io.stop()
+
+
+def pacing_check(iterations: int, latency: float, jitter: float, min_gap: float, seed: int) -> dict:
+    """
+    Sets on a simulated link whose only INVALID responses come from commands
+    sent too soon. Once the pacer has settled on the gap, none may be rejected.
+
+    Args:
+        iterations: number of sets to settle, and then to time
+        latency: simulated seconds per command
+        jitter: simulated extra seconds per command
+        min_gap: simulated seconds after an answer during which commands are answered INVALID
+        seed: seed of the simulated latencies
+    Returns:
+        result of the timed sets, whose invalid count must be zero
+    """
+    tc = itc.TemperatureController(simulator.SimulatedInstrument.resource_name,
+                                   simulator.SimulatedResourceManager(
+                                       latency=latency, jitter=jitter, min_gap=min_gap, seed=seed))
+    temperature = DEVICES["MB1"]
+    p = current_p(tc, temperature)
+    for i in range(iterations):
+        tc.set_p(p, temperature)
+    result = measure(tc, "paced_set", lambda: tc.set_p(p, temperature), iterations)
+    result["min_gap_ms"] = 1000.0 * min_gap
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Finds benchmarks that got slower than a baseline run
+
+    Args:
+        results: results of this run
+        baseline: results of an earlier run
+        tolerance: allowed fractional drop in calls per second
+    Returns:
+        description of every regression
+    """
+    previous = {result["name"]: result for result in baseline["benchmarks"]}
+    regressions = []
+    for result in results["benchmarks"]:
+        old = previous.get(result["name"])
+        if not old or "skipped" in result or "skipped" in old:
+            continue
+        if result["calls_per_second"] < (1.0 - tolerance) * old["calls_per_second"]:
+            regressions.append("%s: %.1f -> %.1f calls/s" % (
+                result["name"], old["calls_per_second"], result["calls_per_second"]))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Mercury iTC driver and polling benchmarks")
+    parser.add_argument("--resource", help="VISA resource of a real instrument, simulator if omitted")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.002, help="simulated seconds per command")
+    parser.add_argument("--jitter", type=float, default=0.001, help="simulated extra seconds per command")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="simulated fraction of INVALID responses")
+    parser.add_argument("--min-gap", type=float, default=0.0,
+                        help="simulated seconds after an answer during which commands are answered INVALID")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results to this JSON file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed fractional throughput drop")
+    parser.add_argument("--pacing-gap", type=float, default=0.01,
+                        help="simulated minimum gap (s) of the pacing check, run without --resource only")
+    args = parser.parse_args(argv)
+
+    if args.resource:
+        tc = itc.TemperatureController(args.resource)
+    else:
+        tc = itc.TemperatureController(simulator.SimulatedInstrument.resource_name,
+                                       simulator.SimulatedResourceManager(
+                                           latency=args.latency, jitter=args.jitter,
+                                           invalid_rate=args.invalid_rate, min_gap=args.min_gap,
+                                           seed=args.seed))
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "resource": args.resource or "simulator",
+        "settings": {
+            "iterations": args.iterations,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "invalid_rate": args.invalid_rate,
+            "min_gap": args.min_gap,
+        },
+        "benchmarks": driver_benchmarks(tc, args.iterations) + thread_benchmarks(tc, args.iterations),
+    }
+    regressions = []
+    if not args.resource:
+        check = pacing_check(args.iterations, args.latency, args.jitter, args.pacing_gap, args.seed)
+        results["benchmarks"].append(check)
+        if check["invalid"]:
+            regressions.append("paced_set: %d sets rejected after the pacer settled" % check["invalid"])
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions += compare(results, json.load(baseline), args.tolerance)
+    for regression in regressions:
+        sys.stderr.write("regression: %s\n" % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from mercuryITC import MalformedResponse
+from typing import NamedTuple
+import constants
+import json
+import os
+
+
+# signals of each device type, and the one shown on the front panel
+SIGNALS = {
+    "TEMP": ("TEMP", "VOLT", "CURR", "POWR", "RES", "SLOP"),
+    "HTR": ("VOLT", "CURR", "POWR"),
+    "AUX": ("PERC",),
+    "PRES": ("PRES",),
+}
+MEASURES = {"TEMP": "TEMP", "HTR": "VOLT", "AUX": "PERC", "PRES": "PRES"}
+
+# suffix of the front panel name of each device type, e.g. VTI_Hx_MB1.T
+SUFFIXES = {"TEMP": "T", "HTR": "V", "AUX": "%", "PRES": "P"}
+
+# discovered catalogs of every instrument seen, keyed by *IDN?
+CACHE_PATH = os.path.join(os.path.expanduser("~"), ".mercuryitc", "catalog.json")
+
+
+class Device(NamedTuple):
+    """
+    Device of the catalog
+
+    Attributes:
+        uid: unique ID of the device, e.g. MB1.T1
+        kind: device type, e.g. TEMP, HTR or AUX
+        nick: front panel nickname, empty if none is set
+        heater: UID of the heater driven by the loop of a TEMP device
+        aux: UID of the gas flow driven by the loop of a TEMP device
+    """
+    uid: str
+    kind: str
+    nick: str = ""
+    heater: str = ""
+    aux: str = ""
+
+    @property
+    def address(self) -> str:
+        return "DEV:%s:%s" % (self.uid, self.kind)
+
+    @property
+    def board(self) -> str:
+        return self.uid.split(".")[0]
+
+    @property
+    def signals(self) -> tuple:
+        return SIGNALS.get(self.kind, ())
+
+    @property
+    def measure(self) -> str:
+        return MEASURES.get(self.kind, self.kind)
+
+    @property
+    def name(self) -> str:
+        suffix = SUFFIXES.get(self.kind, self.kind)
+        if self.nick:
+            return "%s_%s.%s" % (self.nick, self.board, suffix)
+        return "%s.%s" % (self.uid, suffix)
+
+
+class Catalog:
+    """
+    Devices of one Mercury iTC, discovered from SYS:CAT, and the lookup tables
+    of constants.py built from them
+
+    Attributes:
+        identity: *IDN? response of the instrument
+        devices: devices in catalog order
+    """
+
+    def __init__(self, identity: str, devices: list):
+        self.identity = identity
+        self.devices = devices
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Catalog":
+        return cls(data["identity"], [Device(**device) for device in data["devices"]])
+
+    def to_dict(self) -> dict:
+        return {"identity": self.identity, "devices": [device._asdict() for device in self.devices]}
+
+    def ids(self) -> dict:
+        """
+        Device ID of every device, the board (e.g. MB1) unless several devices
+        share a board
+
+        Returns:
+            device ID of each UID
+        """
+        boards = [device.board for device in self.devices]
+        return {device.uid: device.board if boards.count(device.board) == 1 else device.uid.replace(".", "_")
+                for device in self.devices}
+
+    def tables(self) -> dict:
+        """
+        Builds the lookup tables of constants.py for this instrument
+
+        Returns:
+            DEVICES, SENSORS, COMMANDS, TEMP_HEATERS, CONTROLS, PANEL_METERS,
+            HISTORY_CHANNELS and PLOT_PANELS
+        """
+        ids = self.ids()
+        by_uid = {device.uid: device for device in self.devices}
+        devices = {}
+        sensors = {}
+        commands = {}
+        temp_heaters = {}
+        controls = {"Heat": {}, "Flow": "", "Set Point": {}, "PID": {}}
+        meters = {}
+        for device in self.devices:
+            key = ids[device.uid]
+            devices[key] = device.address
+            # motherboard devices are read every cycle, daughter boards less often
+            sensors[key] = [device.name, "primary" if device.board.startswith("MB") else "secondary"]
+            commands[key] = device.measure
+            if device.kind != "TEMP":
+                continue
+            controls["Heat"][device.name] = device.address
+            controls["Set Point"][device.name] = device.address
+            meters[key] = []
+            heater = by_uid.get(device.heater)
+            if heater:
+                temp_heaters[device.name] = [ids[heater.uid], device.address]
+                controls["PID"][heater.name] = heater.address
+                meters[key].append("%s:RATIO" % ids[heater.uid])
+            aux = by_uid.get(device.aux)
+            if aux:
+                controls["Flow"] = controls["Flow"] or aux.address
+                meters[key].append("%s:%s" % (ids[aux.uid], aux.measure))
+
+        ratios = ["%s:RATIO" % device for device in commands if commands[device] == "VOLT"]
+        plot_panels = [
+            ["Temperature (K)", [device for device in commands if commands[device] == "TEMP"]],
+            ["Heater power (%)", ratios],
+            ["Gas flow (%)", [device for device in commands if commands[device] == "PERC"]],
+        ]
+        return {
+            "DEVICES": devices,
+            "SENSORS": sensors,
+            "COMMANDS": commands,
+            "TEMP_HEATERS": temp_heaters,
+            "CONTROLS": controls,
+            "PANEL_METERS": {device: channels for device, channels in meters.items() if channels},
+            "HISTORY_CHANNELS": list(devices) + ratios,
+            "PLOT_PANELS": [panel for panel in plot_panels if panel[1]],
+        }
+
+    def install(self, module=constants) -> bool:
+        """
+        Replaces the contents of the lookup tables in place, so every module
+        that imported them sees the discovered devices
+
+        Args:
+            module: module holding the tables
+        Returns:
+            True if any table changed
+        """
+        changed = False
+        for name, table in self.tables().items():
+            current = getattr(module, name)
+            if current == table:
+                continue
+            changed = True
+            if isinstance(current, dict):
+                current.clear()
+                current.update(table)
+            else:
+                current[:] = table
+        return changed
+
+
+def _text(raw: bytes, echo: str) -> str:
+    # nicknames are free text, so the value is taken verbatim after the echo
+    prefix = b"STAT:" + echo.encode("ascii") + b":"
+    if not raw.startswith(prefix):
+        raise MalformedResponse("unexpected response %r" % raw)
+    text = raw[len(prefix):].rstrip(b"\r\n").decode("ascii", "replace")
+    return "" if text in ("INVALID", "None", "NONE", "NOT_FOUND") else text
+
+
+def load(path: str = CACHE_PATH) -> dict:
+    """
+    Reads the catalog cache
+
+    Args:
+        path: cache file
+    Returns:
+        catalogs keyed by *IDN?, empty if there is no readable cache
+    """
+    try:
+        with open(path) as cache:
+            return json.load(cache)
+    except (OSError, ValueError):
+        return {}
+
+
+def save(catalog: Catalog, path: str = CACHE_PATH) -> None:
+    """
+    Adds a catalog to the cache
+
+    Args:
+        catalog: discovered catalog
+        path: cache file
+    """
+    catalogs = load(path)
+    catalogs[catalog.identity] = catalog.to_dict()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # write a new file and swap it in, a crash never leaves a truncated cache
+    with open(path + ".tmp", "w") as cache:
+        json.dump(catalogs, cache, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def discover(tc, path: str = CACHE_PATH, refresh: bool = False) -> Catalog:
+    """
+    Finds the devices of an instrument. A known instrument is answered from the
+    cache after a single *IDN? query; otherwise SYS:CAT is read and the nickname
+    and loop assignments of all devices are read in one round trip.
+
+    Args:
+        tc: temperature controller
+        path: cache file, not used if None
+        refresh: rediscover even if the instrument is cached
+    Returns:
+        catalog of the instrument
+    """
+    identity = tc.identity
+    if path and not refresh:
+        cached = load(path).get(identity)
+        if cached:
+            return Catalog.from_dict(cached)
+
+    addresses = tc.devices
+    queries = []
+    for address in addresses:
+        queries.append("%s:NICK" % address)
+        if address.endswith(":TEMP"):
+            queries.extend(["%s:LOOP:HTR" % address, "%s:LOOP:AUX" % address])
+    responses = dict(zip(queries, tc.exchange(["READ:%s" % query for query in queries])))
+
+    devices = []
+    for address in addresses:
+        dev, uid, kind = address.split(":")
+        fields = {}
+        for field, query in (("nick", "%s:NICK"), ("heater", "%s:LOOP:HTR"), ("aux", "%s:LOOP:AUX")):
+            if query % address in responses:
+                fields[field] = _text(responses[query % address], query % address)
+        if fields.get("nick") == uid:
+            fields["nick"] = ""
+        devices.append(Device(uid, kind, **fields))
+
+    catalog = Catalog(identity, devices)
+    if path:
+        save(catalog, path)
+    return catalog
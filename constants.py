@@ -33,3 +33,39 @@ CONTROLS = {
     },
     "PID": {"Hx_htr_MB0.V": "DEV:MB0.H1:HTR", "SR_htr_DB1.V": "DEV:DB1.H1:HTR"},
 }
+
+# polling period (s) and priority of each sensor role, and of the heater page
+POLL_PERIODS = {"primary": 1.0, "secondary": 4.0, "heater": 2.0}
+POLL_PRIORITIES = {"primary": 0, "secondary": 1, "heater": 1}
+
+# faster polling (period, duration in s) of the gas flow after a flow write
+FLOW_BOOST = (1.0, 10.0)
+
+# time (s) after which a queued write that has not completed is reported as timed out
+WRITE_TIMEOUT = 10.0
+
+# time (s) to wait for the I/O threads of the previous port to finish when switching ports
+STOP_TIMEOUT = 5.0
+
+# memory (bytes) for the in-memory history of all front panel channels
+HISTORY_BUDGET = 256 * 1024 ** 2
+HISTORY_CHANNELS = list(DEVICES) + ["%s:RATIO" % device for device in COMMANDS if COMMANDS[device] == "VOLT"]
+
+# plot page: panels of channels, selectable time spans (s) and redraw rate cap (frames/s)
+PLOT_PANELS = [
+    ["Temperature (K)", ["MB1", "DB6"]],
+    ["Heater power (%)", ["MB0:RATIO", "DB1:RATIO"]],
+    ["Gas flow (%)", ["DB4"]],
+]
+PLOT_SPANS = {"10 min": 600, "1 h": 3600, "24 h": 86400}
+PLOT_FPS = 5
+
+# GUI updates: snapshots applied per second at most, and the change of a value
+# below which a widget is not updated, per signal
+PANEL_FPS = 10
+PANEL_DEADBAND = {"TEMP": 0.001, "VOLT": 0.001, "PERC": 0.01, "RATIO": 0.1}
+
+# front panel: meter bars shown on the panel of a device, as channels (device:signal)
+PANEL_METERS = {"MB1": ["MB0:RATIO", "DB4:PERC"], "DB6": ["DB1:RATIO"]}
+# the panel grid grows beyond this number of columns only for large systems
+PANEL_COLUMNS = 3
@@ -1,10 +1,20 @@
 import sys
+import argparse
+import math
 import time
 import threading 
 import mercuryITC as itc
+import acquisition
+import arbiter
+import catalog
+import probe
+import history
+import writequeue
 import serial.tools.list_ports
 import pyvisa as visa
-from PyQt5.QtGui import QDoubleValidator
+import numpy as np
+from PyQt5.QtGui import QDoubleValidator, QPainter, QPen, QColor, QPolygonF
+from PyQt5.QtCore import QPointF, QRectF
 from PyQt5.QtCore import QObject, QTimer, QThread, pyqtSignal, pyqtSlot, Qt, QEvent
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QStackedWidget, \
 							QGridLayout, QLabel, QLineEdit, QComboBox, QStatusBar, \
@@ -14,8 +24,13 @@ from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QStackedWidget,
 import constants
 
 class MainWindow(QMainWindow):
-	def __init__(self, parent=None):
+
+	# Mercury iTCs found by the port probe, {resource: identity}
+	probed = pyqtSignal(dict)
+
+	def __init__(self, parent=None, resource_manager=None):
 		super(MainWindow, self).__init__(parent=parent)
+		self.resource_manager = resource_manager
 		
 		self.central_widget = QStackedWidget()
 		self.setCentralWidget(self.central_widget)
@@ -24,12 +39,21 @@ class MainWindow(QMainWindow):
 		
 		#temperature controller
 		self.tc = None
+		self.arbiter = None
+		self.acquisition = None
 
 		# devices
 		self.devices = constants.DEVICES
 		self.sensor_name = constants.SENSORS
 		self.commands = constants.COMMANDS
 
+		# readings kept for the plot view
+		self.history = history.HistoryStore.for_budget(constants.HISTORY_BUDGET, constants.HISTORY_CHANNELS)
+
+		# every page, the history and loggers get their readings from one bus
+		self.bus = acquisition.ReadingBus()
+		self.bus.subscribe(self.recordSample)
+
 		self.valid_connection = False
 
 		self.sensor_display = sensorUIWindow(self)
@@ -37,16 +61,19 @@ class MainWindow(QMainWindow):
 		self.heater_display	 = heaterUIWindow(self)
 		self.sweep_display = sweepTableUIWindow(self)
 		self.pid_display = pidTableUIWindow(self)
+		self.plot_display = plotUIWindow(self)
 
 		self.central_widget.addWidget(self.sensor_display)
 		self.central_widget.addWidget(self.control_display)
 		self.central_widget.addWidget(self.heater_display)
 		self.central_widget.addWidget(self.sweep_display)
 		self.central_widget.addWidget(self.pid_display)
+		self.central_widget.addWidget(self.plot_display)
 		self.central_widget.setCurrentWidget(self.sensor_display)
 
 		self.sensor_display.control_clicked.connect(lambda: self.central_widget.setCurrentWidget(self.control_display))
 		self.sensor_display.heater_clicked.connect(lambda: self.central_widget.setCurrentWidget(self.heater_display))
+		self.sensor_display.plot_clicked.connect(lambda: self.central_widget.setCurrentWidget(self.plot_display))
 
 		self.control_display.home_clicked.connect(lambda: self.central_widget.setCurrentWidget(self.sensor_display))
 		self.control_display.sweeptable_clicked.connect(lambda: self.central_widget.setCurrentWidget(self.sweep_display))
@@ -59,6 +86,8 @@ class MainWindow(QMainWindow):
 
 		self.pid_display.control_clicked.connect(lambda: self.central_widget.setCurrentWidget(self.control_display))
 
+		self.plot_display.home_clicked.connect(lambda: self.central_widget.setCurrentWidget(self.sensor_display))
+
 	
 		self.createWriterThread()
 		self.selectUSB()
@@ -73,26 +102,74 @@ class MainWindow(QMainWindow):
 		self.valid_connection = False
 		self.statusBar().showMessage("Select PORT")
 
-		self.rm = visa.ResourceManager()
+		self.rm = self.resource_manager or visa.ResourceManager()
 
 		self.serial_ports = sorted(self.rm.list_resources())
 
 		if not self.serial_ports:
 			self.statusBar().showMessage("No available ports")
 
+		self.port_actions = {}
 		for ports in self.serial_ports:
 			com = QAction(ports, self)
+			com.setData(ports)
 			self.port_selection.addAction(com)
-			self.port_selection.triggered[QAction].connect(self.portClicked)
+			self.port_actions[ports] = com
+		self.port_selection.triggered[QAction].connect(self.portClicked)
+
+		# every port is asked for *IDN? at once in the background
+		if self.serial_ports:
+			self.statusBar().showMessage("Searching for Mercury iTC")
+			self.probed.connect(self.portsProbed)
+			threading.Thread(target=lambda: self.probed.emit(probe.probe(self.serial_ports, self.rm)),
+							 daemon=True).start()
+
+	@pyqtSlot(dict)
+	def portsProbed(self, found):
+		for resource, identity in found.items():
+			if resource in self.port_actions:
+				# e.g. ASRL3::INSTR - MERCURY ITC 123456
+				fields = identity.split(":")
+				self.port_actions[resource].setText("%s - %s" % (resource, " ".join(fields[2:4])))
+		if self.valid_connection:
+			return
+		target = probe.reconnect_target(found)
+		if target:
+			self.portClicked(self.port_actions[target])
+		elif found:
+			self.statusBar().showMessage("Found Mercury iTC on " + ", ".join(sorted(found)))
+		else:
+			self.statusBar().showMessage("No Mercury iTC found, select PORT")
 
 
 	def portClicked(self, port):
 		
-		self.com_port = port.text()
+		self.com_port = port.data() or port.text()
 
 		try:
 			self.serial_ports = sorted(self.rm.list_resources())
-			self.tc = itc.TemperatureController(self.com_port)
+			# the old threads must be done with the port before it is closed and reopened
+			if self.acquisition:
+				self.acquisition.stop()
+			if self.arbiter:
+				self.arbiter.stop(discard=True)
+			if self.acquisition:
+				self.acquisition.join(constants.STOP_TIMEOUT)
+			if self.arbiter:
+				self.arbiter.join(constants.STOP_TIMEOUT)
+			if self.tc:
+				# a transaction still in flight fails instead of reopening the port
+				self.tc.session.close()
+			self.tc = itc.TemperatureController(self.com_port, self.rm)
+			self.discoverDevices()
+			probe.remember(self.com_port, self.tc.identity)
+			# all pages share the instrument through a single I/O thread
+			self.arbiter = arbiter.InstrumentArbiter(self.tc)
+			self.arbiter.start()
+			# and poll it through a single acquisition loop
+			self.acquisition = acquisition.AcquisitionCore(self.arbiter.proxy(arbiter.PRIMARY), self.bus)
+			self.acquisition.start()
+			self.recordDevices()
 			self.valid_connection = True
 			self.createWriterThread()
 			self.central_widget.currentWidget().startThread()
@@ -100,9 +177,52 @@ class MainWindow(QMainWindow):
 		except:
 			self.statusBar().showMessage("ITC not connected to PORT " + self.com_port)
 			self.valid_connection = False
-			self.sensor_display.panel.connected(self.valid_connection)
 
 
+	def discoverDevices(self):
+		# a known instrument is looked up in the catalog cache after one *IDN? query
+		try:
+			changed = catalog.discover(self.tc).install()
+		except Exception:
+			# keep the built-in device tables
+			return
+		if changed:
+			self.sensor_display.rebuildPanel()
+			self.control_display.refreshSensors()
+			self.heater_display.rebuildHeaters()
+			# the discovered channels share the same memory budget as the built-in ones
+			self.history.fit(constants.HISTORY_BUDGET, constants.HISTORY_CHANNELS)
+
+	def io(self, priority):
+		if self.arbiter:
+			return self.arbiter.proxy(priority)
+		return self.tc
+
+	def request(self, owner, device, signals, role):
+		if self.acquisition:
+			self.acquisition.request(owner, device, signals, constants.POLL_PERIODS[role], constants.POLL_PRIORITIES[role])
+
+	def release(self, owner):
+		if self.acquisition:
+			self.acquisition.release(owner)
+
+	def boost(self, device):
+		if self.acquisition:
+			self.acquisition.boost(device, *constants.FLOW_BOOST)
+
+	def recordDevices(self):
+		# the history keeps recording the front panel devices whichever page is shown
+		for device, name in self.sensor_name.items():
+			self.request("history", device, [self.commands[device]], name[1])
+
+	def recordSample(self, sample):
+		if sample.reading.value is None:
+			return
+		if sample.signal == "RATIO":
+			self.history.append("%s:RATIO" % sample.device, sample.reading.value, sample.timestamp)
+		elif sample.signal == self.commands.get(sample.device):
+			self.history.append(sample.device, sample.reading.value, sample.timestamp)
+
 	def createWriterThread(self):
 		self.write = writerThread(self)
 		self.writer_thread = QThread(self)
@@ -110,13 +230,11 @@ class MainWindow(QMainWindow):
 		self.connectWriterThread()
 
 	def assignWriterThread(self):
-		self.write.itc(self.tc)
+		self.write.itc(self.io(arbiter.WRITE))
 		self.write.connected(self.valid_connection)
 
 	def connectWriterThread(self):
 		self.write.moveToThread(self.writer_thread)
-		# self.writer_thread.started.connect(self.write.get_max_voltage)
-		self.writer_thread.started.connect(self.write.tryWrite)
 		self.write.write.connect(self.displayWriteReadMessage)
 		self.writer_thread.start()
 
@@ -128,6 +246,7 @@ class sensorUIWindow(QWidget):
 
 	control_clicked = pyqtSignal()
 	heater_clicked = pyqtSignal()
+	plot_clicked = pyqtSignal()
 
 	def __init__(self, parent=None):
 		super(sensorUIWindow, self).__init__(parent=parent)
@@ -147,7 +266,14 @@ class sensorUIWindow(QWidget):
 		self.mainDisplay = QGridLayout()
 		self.setStyleSheet("background-color: black; margin:0px; border:0px solid rgb(128, 128, 128); ")
 		self.setLayout(self.background_layout)
-		self.background_layout.addLayout(self.mainDisplay)
+
+		# larger systems scroll instead of squeezing the device panels
+		self.display_contents = QWidget()
+		self.display_contents.setLayout(self.mainDisplay)
+		self.display_scroll = QScrollArea(self)
+		self.display_scroll.setWidgetResizable(True)
+		self.display_scroll.setWidget(self.display_contents)
+		self.background_layout.addWidget(self.display_scroll)
 
 		# devices
 		self.devices = self.parent.devices
@@ -171,34 +297,54 @@ class sensorUIWindow(QWidget):
 	def deviceWidget(self):
 
 		self.panel_widgets = {}
+		# channel -> widget updates, built once so every sample is routed in O(1)
+		self.routes = {}
+		# device -> signals polled for the panel
+		self.signals = {}
 
 		for device, name in self.sensor_name.items():
 			self.panel_widgets[device] = createDisplayObject()
 			self.panel_widgets[device].setTitle(name[0])
 			self.panel_widgets[device].setReading("N/A")
 
-			if 'T' in name[0].split('.'):
-				if name[0] == 'VTI_Hx_MB1.T':
-					self.panel_widgets[device].createMeterBar(self.devices['MB0'])
-					self.panel_widgets[device].createMeterBar(self.devices['DB4'])
-				else:
-					self.panel_widgets[device].createMeterBar(self.devices['DB1'])
+			channel = "%s:%s" % (device, self.commands[device])
+			self.route(channel, lambda sample, panel=self.panel_widgets[device]:
+								panel.updateReading(sample.reading.text))
+
+			for meter in constants.PANEL_METERS.get(device, []):
+				meter_device = meter.split(':')[0]
+				self.panel_widgets[device].createMeterBar(meter, self.devices[meter_device].split(':')[1])
+				self.route(meter, lambda sample, panel=self.panel_widgets[device], meter=meter:
+								panel.updateMeterBar(meter, sample.reading.value or 0.0))
 
 			self.panel_widgets[device].createDeviceContainer()
 
 		self.frontPanel()
 
+	def route(self, channel, update):
+		device, signal = channel.split(':')
+		self.routes.setdefault(channel, []).append(update)
+		# the power ratio is derived from the heater voltage
+		self.signals.setdefault(device, set()).add("VOLT" if signal == "RATIO" else signal)
+
+	def rebuildPanel(self):
+		for panel in self.panel_widgets.values():
+			self.mainDisplay.removeWidget(panel.get_deviceContainer())
+			panel.get_deviceContainer().deleteLater()
+			panel.deleteLater()
+		self.deviceWidget()
+
 	def frontPanel(self):
 
-		row = 0
-		col = 0
+		columns = max(constants.PANEL_COLUMNS, math.ceil(math.sqrt(len(self.panel_widgets))))
 
-		for display in self.panel_widgets:
-			if col == 3:
-				col = 0
-				row = 1
+		for index, display in enumerate(self.panel_widgets):
+			row, col = divmod(index, columns)
 			self.mainDisplay.addWidget(self.panel_widgets[display].get_deviceContainer(), row, col)
-			col += 1
+
+		# two rows of panels are always shown, further rows scroll
+		rows = math.ceil(len(self.panel_widgets) / columns)
+		self.display_scroll.setMinimumHeight(min(rows, 2) * 210 + 10)
 
 
 	def panelOptions(self):
@@ -211,7 +357,11 @@ class sensorUIWindow(QWidget):
 
 		for option in options_panel:
 			self.lower_display.addWidget(option.getHoverButton())
-			option.getHoverButton().clicked.connect(self.pauseThread)
+			# the plot page shows the readings of this thread, keep polling
+			if option.name != "Plot":
+				option.getHoverButton().clicked.connect(self.pauseThread)
+
+		options_panel[0].getHoverButton().clicked.connect(self.plot_clicked.emit)
 
 		options_panel[1].getHoverButton().clicked.connect(self.resumeControlDisplay)
 		options_panel[1].getHoverButton().clicked.connect(self.control_clicked.emit)
@@ -227,52 +377,44 @@ class sensorUIWindow(QWidget):
 		self.parent.control_display.startThread()
 
 	def createThreading(self):
-		self.panel = panelThread(self)
-		self.thread = QThread(self)
-		self.connectThreading()
-
-	def connectThreading(self):
-		self.panel.itc(self.parent.tc)
-		self.panel.selectDevice(self.sensor_name, self.commands)
-		self.panel.connected(self.parent.valid_connection)
-		self.panel.moveToThread(self.thread)
-		self.thread.started.connect(self.panel.monitorValues)
+		self.panel = readingBridge(self.parent.bus, self)
 		self.panel.signal.connect(self.monitorValues)
-		self.panel.ended.connect(self.thread.quit)
 
 	def startThread(self):
-		self.panel.selectDevice(self.sensor_name, self.commands)
-		self.panel.connected(self.parent.valid_connection)
-		self.panel.itc(self.parent.tc)
-		self.panel.resume()
-		self.thread.start()
+		if not self.parent.valid_connection:
+			for panel in self.panel_widgets.values():
+				panel.updateReading("N/A")
+				for meter in panel.meter_reading:
+					panel.updateMeterBar(meter, 0.0)
+			return
+		for device, signals in self.signals.items():
+			self.parent.request("panel", device, list(signals), self.sensor_name[device][1])
+		self.panel.subscribe(list(self.routes))
 
 	def pauseThread(self):
-		self.panel.pause()
-
-	@pyqtSlot(list)
-	def monitorValues(self, reading):
-		if reading[1] != "INVALID":
-			if isinstance(reading[1], str):
-				if reading[0] == "DB4":
-					self.panel_widgets[reading[0]].updateReading(reading[1])
-					try:
-						self.panel_widgets["MB1"].updateMeterBar(self.devices[reading[0]], float(reading[1][:-1]))
-					except:
-						self.panel_widgets["MB1"].updateMeterBar(self.devices[reading[0]], 0.0)
-				else:
-					self.panel_widgets[reading[0]].updateReading(reading[1])
-			else:
-				if reading[0] == "MB0":
-					self.panel_widgets["MB1"].updateMeterBar(self.devices[reading[0]], reading[1])
-				elif reading[0] == "DB1":
-					self.panel_widgets["DB6"].updateMeterBar(self.devices[reading[0]], reading[1])
+		self.panel.unsubscribe()
+		self.parent.release("panel")
+
+	@pyqtSlot(dict)
+	def monitorValues(self, snapshot):
+		# the whole snapshot is applied with a single repaint
+		self.setUpdatesEnabled(False)
+		for sample in snapshot.values():
+			self.updateSample(sample)
+		self.setUpdatesEnabled(True)
+
+	def updateSample(self, sample):
+		if sample.reading.text == "INVALID":
+			return
+		for update in self.routes.get(sample.channel, ()):
+			update(sample)
 			
 
 class createDisplayObject(QMainWindow):
 	def __init__(self, parent=None):
 		super(createDisplayObject, self).__init__(parent=parent)
 		self.meter_reading = {}
+		self.meter_names = {}
 
 	def setTitle(self, title):
 		self.device_title = QLabel(title)
@@ -286,7 +428,7 @@ class createDisplayObject(QMainWindow):
 		# self.device_reading.setFont(QFont("Ariel", 16))
 		self.device_reading.setStyleSheet("background-color: black; font: 30px; color: gold; border: 0px")
 
-	def createMeterBar(self, meter_device=None):
+	def createMeterBar(self, meter_device=None, name=None):
 		if meter_device:
 			self.meter_bar = QProgressBar(self)
 			self.meter_bar.setFixedSize(200, 25)
@@ -299,16 +441,17 @@ class createDisplayObject(QMainWindow):
 					   background-color: #CD96CD; width: 10px; margin: \
 					   1.2px; text-align: center;}"
 			self.meter_bar.setStyleSheet(CSS)
-			self.meter_bar.setValue(0.0)
+			self.meter_bar.setValue(0)
 	
 			self.meter_reading[meter_device] = self.meter_bar
+			self.meter_names[meter_device] = name or meter_device
 
 
 	def updateReading(self, reading):
 		self.device_reading.setText(reading)
 
 	def updateMeterBar(self, meter_device, value):
-		self.meter_reading[meter_device].setValue(value)
+		self.meter_reading[meter_device].setValue(int(round(value)))
 
 	def getTitle(self):
 		return self.device_title
@@ -334,8 +477,7 @@ class createDisplayObject(QMainWindow):
 
 		for device, device_meter in self.meter_reading.items():
 			self.meter_layout = QHBoxLayout()
-			device_name = device.split(':')[1]
-			meter_device = QLabel(device_name)
+			meter_device = QLabel(self.meter_names[device])
 			meter_device.setFixedSize(70, 25)
 			meter_device.setStyleSheet("color: white; text-align: center; border: 0px")
 			self.meter_layout.addWidget(meter_device)
@@ -461,85 +603,82 @@ class focusLineEdit(QLineEdit):
 
 
 # Thread
-class panelThread(QObject):
-
-	signal = pyqtSignal(list)
-	ended = pyqtSignal()
-
-	def __init__(self, parent=None):
-		QObject.__init__(self)
-		self.run = False
-		self.connected()
-
-	def connected(self, connect = False):
-		self.connect = connect
-
-	def itc(self, tc):
-		self.tc = tc
-
-	def selectDevice(self, devices, measure):
-		self.devices = devices
-		self.measure = measure
-
-	def pause(self):
-		self.run = False
-
-	def resume(self):
-		self.run = True
+class readingBridge(QObject):
+
+	# snapshot of the changed channels, {channel: sample}
+	signal = pyqtSignal(dict)
+	ready = pyqtSignal()
+
+	def __init__(self, bus, parent=None, fps=constants.PANEL_FPS, deadband=constants.PANEL_DEADBAND):
+		QObject.__init__(self, parent)
+		self.bus = bus
+		self.subscription = None
+		self.interval = 1.0 / fps
+		self.deadband = deadband
+
+		# samples collected on the acquisition thread until the next flush
+		self.lock = threading.Lock()
+		self.pending = {}
+		self.scheduled = False
+		self.applied = {}
+		self.flushed = 0.0
+
+		self.timer = QTimer(self)
+		self.timer.setSingleShot(True)
+		self.timer.timeout.connect(self.flush)
+		self.ready.connect(self.flush)
+
+	def subscribe(self, channels=None, period=0.0):
+		self.unsubscribe()
+		self.subscription = self.bus.subscribe(self.collect, channels, period, batch=True)
+
+	def unsubscribe(self):
+		if self.subscription:
+			self.bus.unsubscribe(self.subscription)
+			self.subscription = None
+		with self.lock:
+			self.pending = {}
+		# widgets are refreshed in full on the next subscription
+		self.applied = {}
+
+	def collect(self, samples):
+		# runs on the acquisition thread, at most one signal crosses to the GUI thread per flush
+		with self.lock:
+			for sample in samples:
+				self.pending[sample.channel] = sample
+			if self.scheduled:
+				return
+			self.scheduled = True
+		self.ready.emit()
 
 	@pyqtSlot()
-	def monitorValues(self):
-		time.sleep(1)
-		secondary_refresh = 0
-		gas_set = 0
-		for device in self.measure:
-			if self.measure[device] == "VOLT":
-				self.tc.get_max_voltage(device)
-				self.tc.close()
-				self.tc.open()
-		max_voltages = self.tc.get_max_voltage()
-		power_ratio = 0.0
-		while self.run:
-			if self.connect:
-				for device in self.devices:
-					if self.devices[device][1] == 'primary':
-						value = self.tc.get_signal(device, self.measure[device])
-						self.signal.emit(value)
-						self.tc.close()
-						self.tc.open()
-					else:
-						if secondary_refresh == 0:
-							value = self.tc.get_signal(device, self.measure[device])
-							self.signal.emit(value)
-							self.tc.close()
-							self.tc.open()
-					if self.measure[value[0]] == "VOLT" and value[1] != "INVALID":
-						try:
-							power_ratio = 100 * (float(value[1][:-1]) / float(max_voltages[device])) ** 2
-						except:
-							pass
-						self.signal.emit([value[0], power_ratio])
-			else:
-				for device in self.devices:
-					self.signal.emit([device, "N/A"])
-					self.signal.emit([device, 0.0])
-				break
-			if self.devices["DB4"][1] == "primary":
-				gas_set +=1 
-				if gas_set == 10:
-					self.devices["DB4"][1] = "secondary"
-					gas_set = 0
-
-			secondary_refresh += 1
-
-			if secondary_refresh > 3:
-				secondary_refresh = 0
-
-			time.sleep(1)
-		self.ended.emit()
+	def flush(self):
+		# snapshots are capped at the frame rate, later samples of a channel replace earlier ones
+		wait = self.flushed + self.interval - time.monotonic()
+		if wait > 0:
+			self.timer.start(int(1000 * wait) + 1)
+			return
+		with self.lock:
+			pending, self.pending = self.pending, {}
+			self.scheduled = False
+		self.flushed = time.monotonic()
+		snapshot = {channel: sample for channel, sample in pending.items() if self.changed(sample)}
+		if snapshot:
+			self.signal.emit(snapshot)
+
+	def changed(self, sample):
+		previous = self.applied.get(sample.channel)
+		if previous is not None:
+			value, last = sample.reading.value, previous.reading.value
+			if value is None or last is None:
+				if sample.reading.text == previous.reading.text:
+					return False
+			elif abs(value - last) <= self.deadband.get(sample.signal, 0.0):
+				return False
+		self.applied[sample.channel] = sample
+		return True
 
 class heaterThread(QObject):
-	signal = pyqtSignal(list)
 	volt_value = pyqtSignal(list)
 	res_value = pyqtSignal(list)
 	ended = pyqtSignal()
@@ -566,33 +705,18 @@ class heaterThread(QObject):
 
 	@pyqtSlot()
 	def monitorValues(self):
-		if self.connect and self.devices:
+		# the power ratio comes from the acquisition core, only settings are read here
+		if self.connect and self.devices and self.run:
 			for device in self.devices:
+				try:
+					resistance = self.tc.get_resistance(device)
+				except Exception:
+					# the session has retried already, the settings are read again next time
+					break
 				self.volt_value.emit([device, self.tc.get_max_voltage(device)[device]])
-				self.openAndclose()
-				self.res_value.emit(self.tc.get_resistance(device))
-				self.openAndclose()
-
-		while self.run:
-			if self.connect:
-				for device in self.devices:
-					self.signal.emit(self.tc.get_heat_power_ratio(device))
-					self.tc.close()
-					# time.sleep(2)
-					self.tc.open()
-			else:
-				for device in self.devices:
-					self.signal.emit([device, 0.0])
-				break
-			if self.run:
-				time.sleep(2)
+				self.res_value.emit(resistance)
 		self.ended.emit()
 
-	def openAndclose(self):
-		if self.connect:
-			self.tc.close()
-			self.tc.open()
-
 
 class controlThread(QObject):
 	value = pyqtSignal(list)
@@ -640,30 +764,28 @@ class controlThread(QObject):
 
 	@pyqtSlot()
 	def askValues(self, getMethod=None):
-		if self.connect:
-			for i in range(5):
-				try:
-					self.temp = getMethod(self.device)
-					if self.temp == "INVALID":
-						raise Exception
-					self.value.emit(self.temp)
-					break
-				except:
-					pass
-			self.openAndclose()
-
-	def openAndclose(self):
-		if self.connect:
-			self.tc.close()
-			self.tc.open()
+		# retries, backoff and the circuit breaker are handled by the session
+		if self.connect and getMethod:
+			try:
+				self.temp = getMethod(self.device)
+			except Exception:
+				return
+			if self.temp[1] != "INVALID":
+				self.value.emit(self.temp)
 
 
 class writerThread(QObject):
 	write = pyqtSignal(str)
+	# description, success and time from queueing to completion (s) of every write
+	completed = pyqtSignal(str, bool, float)
 
 	def __init__(self, parent=None):
 		QObject.__init__(self)
 		self.run = False
+		self.pending = {}
+		# writes reported as timed out while still on the wire
+		self.expired = set()
+		self.lock = threading.Lock()
 		self.connected()
 
 	def connected(self, connect = False):
@@ -671,13 +793,15 @@ class writerThread(QObject):
 
 	def itc(self, tc):
 		self.tc = tc
+		# edits of one setting collapse to the newest value while a write is on the wire
+		self.queue = writequeue.WriteQueue(tc)
 
 	def set_heater(self, value, device=None):
 		if value < 0.0 or value > 100.0:
 			self.write.emit("heater percentage must be 0-100")
 		else:
 			if self.connect and device:
-				self.tryWrite(self.tc.set_heater, device, "heater %", value)
+				self.queueWrite("set_heater", device, "heater %", value)
 			else:
 				self.write.emit("ITC not connected")
 
@@ -686,7 +810,7 @@ class writerThread(QObject):
 			self.write.emit("flow percentage must be 0-100")
 		else:
 			if self.connect and device:
-				self.tryWrite(self.tc.set_flow, device, "flow %", value)
+				self.queueWrite("set_flow", device, "flow %", value)
 			else:
 				self.write.emit("ITC not connected")
 
@@ -695,25 +819,25 @@ class writerThread(QObject):
 			self.write.emit("set point must be 0-2000")
 		else:
 			if self.connect and device:
-				self.tryWrite(self.tc.set_setpoint, device, "set point", value)
+				self.queueWrite("set_setpoint", device, "set point", value)
 			else:
 				self.write.emit("ITC not connected")
 
 	def set_p(self, value, device=None):
 		if self.connect and device:
-			self.tryWrite(self.tc.set_p, device, "P value", value)
+			self.queueWrite("set_p", device, "P value", value)
 		else:
 			self.write.emit("ITC not connected")
 
 	def set_i(self, value, device=None):
 		if self.connect and device:
-			self.tryWrite(self.tc.set_i, device, "I value", value)
+			self.queueWrite("set_i", device, "I value", value)
 		else:
 			self.write.emit("ITC not connected")
 
 	def set_d(self, value, device=None):
 		if self.connect and device:
-			self.tryWrite(self.tc.set_d, device, "D value", value)
+			self.queueWrite("set_d", device, "D value", value)
 		else:
 			self.write.emit("ITC not connected")
 
@@ -729,7 +853,7 @@ class writerThread(QObject):
 				text = "flow control disabled"
 			else:
 				text = "flow control enabled"
-			self.tryWrite(self.tc.set_flow_setting, device, text, setting)
+			self.queueWrite("set_flow_setting", device, text, setting)
 		else:
 			self.write.emit("ITC not connected")
 
@@ -739,7 +863,7 @@ class writerThread(QObject):
 				text = "set point control disabled"
 			else:
 				text = "set point control enabled"
-			self.tryWrite(self.tc.set_setpoint_setting, device, text, setting)
+			self.queueWrite("set_setpoint_setting", device, text, setting)
 		else:
 			self.write.emit("ITC not connected")
 
@@ -749,57 +873,89 @@ class writerThread(QObject):
 				text = "PID control disabled"
 			else:
 				text = "PID control enabled"
-			self.tryWrite(self.tc.set_pid_setting, device, text, setting)
+			self.queueWrite("set_pid_setting", device, text, setting)
 		else:
 			self.write.emit("ITC not connected")
 
 	def set_max_voltage(self, value, device=None):
 		if self.connect and device:
-			self.tryWrite(self.tc.set_max_voltage, device, "max voltage", value)
+			self.queueWrite("set_max_voltage", device, "max voltage", value)
 		else:
 			self.write.emit("ITC not connected")
 
 	def set_resistance(self, value, device=None):
 		if self.connect and device:
-			self.tryWrite(self.tc.set_resistance, device, "resistance", value)
+			self.queueWrite("set_resistance", device, "resistance", value)
 		else:
 			self.write.emit("ITC not connected")
 
 	def set_sweep_table(self, table, device=None):
 		if self.connect and device:
-			self.tryWrite(self.tc.set_sweep_table, device, "sweep table", table)
+			self.queueWrite("set_sweep_table", device, "sweep table", table)
 		else:
 			self.write.emit("ITC not connected")
 
 	def set_pid_table(self, table, device=None):
 		if self.connect and device:
-			self.tryWrite(self.tc.set_pid_table, device, "pid table", table)
+			self.queueWrite("set_pid_table", device, "pid table", table)
 		else:
 			self.write.emit("ITC not connected")
 
-	@pyqtSlot()
-	def tryWrite(self, setDevice=None, device=None, text=None, value=None):
-		if self.connect and device:
-			for i in range(5):
-				try:
-					if setDevice(value, device) == "VALID":
-						self.write.emit(text + " write succeeded")
-						break
-					else:
-						raise ValueError
-				except:
-					self.write.emit(text + " write failed")
-				self.openAndclose()
-		else:
-			if not self.connect:
-				self.write.emit("ITC not connected")
-
-
-	def openAndclose(self):
-		if self.connect:
-			self.tc.close()
-			# time.sleep(2)  	
-			self.tc.open()
+	def queueWrite(self, method, device, text, value):
+		# returns at once, the outcome is reported through the write and completed signals
+		if not (self.connect and device):
+			self.write.emit("ITC not connected")
+			return None
+		future = self.queue.submit(method, value, device)
+		# a stuck instrument is reported after a while, it never holds up the GUI
+		timer = threading.Timer(constants.WRITE_TIMEOUT, self.expire, (future,))
+		timer.daemon = True
+		self.pending[future] = (method, text, time.monotonic(), timer)
+		timer.start()
+		future.add_done_callback(self.written)
+		return future
+
+	def written(self, future):
+		# runs on the instrument thread, the signals carry the outcome to the GUI
+		with self.lock:
+			entry = self.pending.pop(future, None)
+			late = future in self.expired
+			self.expired.discard(future)
+		if entry is None:
+			return
+		method, text, started, timer = entry
+		timer.cancel()
+		if future.cancelled():
+			# superseded by a newer value of the same setting, or timed out in the queue
+			return
+		elapsed = time.monotonic() - started
+		try:
+			result = future.result()
+		except Exception:
+			result = None
+		success = result is not None and result.status == "VALID"
+		# a write that completes after it was reported as timed out is reported again
+		after = " after timing out" if late else ""
+		if not success:
+			self.write.emit("%s write failed%s" % (text, after))
+		elif result.readback:
+			self.write.emit("%s set to %s%s (%d ms)" % (text, result.readback[1], after, 1000 * elapsed))
+		elif method not in writequeue.READBACK or late:
+			self.write.emit("%s write succeeded%s (%d ms)" % (text, after, 1000 * elapsed))
+		if not late:
+			self.completed.emit(text, success, elapsed)
+
+	def expire(self, future):
+		with self.lock:
+			entry = self.pending.get(future)
+			if entry is None:
+				return
+			self.expired.add(future)
+			method, text, started, timer = entry
+			self.write.emit("%s write timed out" % text)
+			self.completed.emit(text, False, time.monotonic() - started)
+		# a write still queued is dropped, one on the wire reports its outcome when it completes
+		future.cancel()
 
 
 class controlUIWindow(QWidget):
@@ -869,11 +1025,7 @@ class controlUIWindow(QWidget):
 
 	def sensorConfig(self):
 		self.device_selection = QComboBox(self)
-		for device, name, in self.parent.sensor_name.items():
-			if self.parent.sensor_name[device][0].split(".")[1] == "T":
-				self.device_selection.addItem(self.parent.sensor_name[device][0])
-				if name[1] == "primary":
-					self.primary_device = self.parent.devices[device]
+		self.listSensors()
 		self.device_selection.setStyleSheet('color: white; background-color : black; \
 											 border-radius : 5px; font: 24px; \
 											 border:2px solid rgb(0, 122, 122)')
@@ -886,15 +1038,37 @@ class controlUIWindow(QWidget):
 		self.sensor_row.addSpacing(50)
 
 
+	def listSensors(self):
+		# the temperature sensors of the installed catalog, built-in or discovered
+		self.device_selection.clear()
+		self.primary_device = None
+		for device, name in self.parent.sensor_name.items():
+			if self.parent.commands[device] == "TEMP":
+				self.device_selection.addItem(name[0])
+				if name[1] == "primary" and self.primary_device is None:
+					self.primary_device = self.parent.devices[device]
+					self.device_selection.setCurrentIndex(self.device_selection.count() - 1)
+		if self.primary_device is None and self.device_selection.count():
+			self.primaryDevice(self.device_selection.itemText(0))
+
+	def refreshSensors(self):
+		self.listSensors()
+		self.text.selectDevice(self.primary_device)
+
+	def primaryDevice(self, sensor):
+		for device, name in self.parent.sensor_name.items():
+			if name[0] == sensor:
+				self.primary_device = self.parent.devices[device]
+				return device
+
 	def primaryTempSensor(self, sensor):
-		self.primary_device = self.temp_heater_pair[sensor][1]
+		# a sensor without a heater on its loop has no heater role to update
+		selected = self.primaryDevice(sensor)
 		for device, name in self.parent.sensor_name.items():
-			if device in self.primary_device:
-				self.parent.sensor_name[device][1] = "primary"
-				self.parent.sensor_name[self.temp_heater_pair[sensor][0]][1] = 'primary'
-			elif name[0].split(".")[1] == "T":
-				self.parent.sensor_name[device][1] = "secondary"
-				self.parent.sensor_name[self.temp_heater_pair[sensor][0]][1] = 'secondary'
+			if self.parent.commands[device] == "TEMP":
+				name[1] = "primary" if device == selected else "secondary"
+				if name[0] in self.temp_heater_pair:
+					self.parent.sensor_name[self.temp_heater_pair[name[0]][0]][1] = name[1]
 		self.startThread()
 
 
@@ -954,7 +1128,16 @@ class controlUIWindow(QWidget):
 
 	def set_flow(self, device, text):
 		self.parent.write.set_flow(float(text), device)
-		self.parent.sensor_name["DB4"][1] = "primary"
+		flow = self.flowDevice()
+		if flow:
+			self.parent.boost(flow)
+
+	def flowDevice(self):
+		# the gas flow of the installed catalog, None if the loops drive none
+		for device, address in self.parent.devices.items():
+			if address == self.controls["Flow"]:
+				return device
+		return None
 
 	def setSetPoint(self, device, text):
 		self.parent.write.setSetPoint(float(text), device)
@@ -1101,7 +1284,7 @@ class controlUIWindow(QWidget):
 
 	def startThread(self):
 		self.text.connected(self.parent.valid_connection)
-		self.text.itc(self.parent.tc)
+		self.text.itc(self.parent.io(arbiter.PID))
 		self.text.selectDevice(self.primary_device)
 		self.text.resume()
 		self.thread.start()
@@ -1112,7 +1295,7 @@ class controlUIWindow(QWidget):
 		self.connectThreading()
 
 	def connectThreading(self):
-		self.text.itc(self.parent.tc)
+		self.text.itc(self.parent.io(arbiter.PID))
 		self.text.selectDevice(self.primary_device)
 		self.text.connected(self.parent.valid_connection)
 		self.text.moveToThread(self.thread)
@@ -1187,23 +1370,47 @@ class heaterUIWindow(QWidget):
 		self.res_col.addWidget(self.heater_titles['res'])
 		self.power_col.addWidget(self.heater_titles['power'])
 
+		self.createHeaterRows()
+		self.createThreading()
+
+	def createHeaterRows(self):
+		# one row per heater of the installed catalog, built-in or discovered
+		self.heaters = [device for device in self.sensor_name if self.parent.commands[device] == "VOLT"]
 		self.createHeaterLabels()
 		self.createDeviceInputs()
 		self.createMaxVoltInputs()
 		self.createResInputs()
 		self.createMeterBar()
-		self.createThreading()
 
+	def rebuildHeaters(self):
+		for label in self.heater_names.values():
+			label.deleteLater()
+		for inputs in (self.device_inputs, self.voltlim_inputs, self.res_inputs):
+			for device in inputs:
+				inputs[device].getFocusLineEdit().deleteLater()
+		for meter in self.meter_reading.values():
+			meter.deleteLater()
+		self.createHeaterRows()
+		self.meter.selectDevice(list(self.heater_names.keys()))
+
+	def addRow(self, column, widget):
+		# rows go above the stretch closing each column, once it has been added
+		index = column.count()
+		if index and column.itemAt(index - 1).spacerItem():
+			index -= 1
+		column.insertWidget(index, widget)
 
 	def createHeaterLabels(self):
-		self.heater_names = {"DB1" : QLabel("DB1.H1"), "MB0" : QLabel('MB0.H1')}
+		self.heater_names = {}
+		for device in self.heaters:
+			self.heater_names[device] = QLabel(self.devices[device].split(":")[1])
 
 		for name in self.heater_names:
 			self.heater_names[name].setStyleSheet('color: white; border: 0px; font: 24px')
 			self.heater_names[name].setFixedWidth(130)
 			self.heater_names[name].setFixedHeight(75)
 			self.heater_names[name].setAlignment(Qt.AlignCenter)
-			self.heater_col.addWidget(self.heater_names[name])
+			self.addRow(self.heater_col, self.heater_names[name])
 
 	def createDeviceInputs(self):
 		self.device_inputs = {}
@@ -1211,25 +1418,23 @@ class heaterUIWindow(QWidget):
 			self.device_inputs[device] = focusLineEdit(self.devices[device])
 			self.device_inputs[device].createFocusLineEdit()
 			self.device_inputs[device].getFocusLineEdit().setText(self.sensor_name[device][0].split(".")[0])
-			self.name_col.addWidget(self.device_inputs[device].getFocusLineEdit())
+			self.addRow(self.name_col, self.device_inputs[device].getFocusLineEdit())
 
 	def createMaxVoltInputs(self):
 		self.voltlim_inputs = {}
 		for device in self.device_inputs:
 			self.voltlim_inputs[device] = focusLineEdit(device)
 			self.voltlim_inputs[device].createSmallFocusLineEdit()
-			self.volt_col.addWidget(self.voltlim_inputs[device].getSmallFocusLineEdit())
-		self.voltlim_inputs["DB1"].getSmallFocusLineEdit().returnPressed.connect(lambda: self.updateMaxVoltage("DB1", self.voltlim_inputs["DB1"].getSmallFocusLineEdit().text()))
-		self.voltlim_inputs["MB0"].getSmallFocusLineEdit().returnPressed.connect(lambda: self.updateMaxVoltage("MB0", self.voltlim_inputs["MB0"].getSmallFocusLineEdit().text()))
+			self.addRow(self.volt_col, self.voltlim_inputs[device].getSmallFocusLineEdit())
+			self.voltlim_inputs[device].getSmallFocusLineEdit().returnPressed.connect(lambda device=device: self.updateMaxVoltage(device, self.voltlim_inputs[device].getSmallFocusLineEdit().text()))
 
 	def createResInputs(self):
 		self.res_inputs = {}
 		for device in self.device_inputs:
 			self.res_inputs[device] = focusLineEdit(device)
 			self.res_inputs[device].createSmallFocusLineEdit()
-			self.res_col.addWidget(self.res_inputs[device].getSmallFocusLineEdit())
-		self.res_inputs["DB1"].getSmallFocusLineEdit().returnPressed.connect(lambda: self.updateResistance("DB1", self.res_inputs["DB1"].getSmallFocusLineEdit().text()))
-		self.res_inputs["MB0"].getSmallFocusLineEdit().returnPressed.connect(lambda: self.updateResistance("MB0", self.res_inputs["MB0"].getSmallFocusLineEdit().text()))
+			self.addRow(self.res_col, self.res_inputs[device].getSmallFocusLineEdit())
+			self.res_inputs[device].getSmallFocusLineEdit().returnPressed.connect(lambda device=device: self.updateResistance(device, self.res_inputs[device].getSmallFocusLineEdit().text()))
 
 
 	def updateMaxVoltage(self, device, value):
@@ -1242,24 +1447,25 @@ class heaterUIWindow(QWidget):
 		self.meter_reading = {}
 		CSS_1 = "QProgressBar {color : white; font : bold; text-align : center; border-radius : 5px; \
 							   border: 2px solid rgb(0, 122, 122); }"
-		for device, names in constants.SENSORS.items():
-			if names[0].split('.')[1] == 'V':
-				self.meter_reading[device] = QProgressBar(self)
-				self.meter_reading[device].setFixedSize(200, 25)
-				if device == 'DB1':
-					CSS_2 = "QProgressBar::chunk {background-color: #05B8CC; width: 10px; margin: 1.2px; }"
-				else:
-					CSS_2 = "QProgressBar::chunk {background-color: #CD96CD; width: 10px; margin: 1.2px; }"
-				
-				self.meter_reading[device].setStyleSheet(CSS_1+CSS_2)
-				self.meter_reading[device].setValue(0.0)
+		for device in self.heaters:
+			self.meter_reading[device] = QProgressBar(self)
+			self.meter_reading[device].setFixedSize(200, 25)
+			if not device.startswith('MB'):
+				CSS_2 = "QProgressBar::chunk {background-color: #05B8CC; width: 10px; margin: 1.2px; }"
+			else:
+				CSS_2 = "QProgressBar::chunk {background-color: #CD96CD; width: 10px; margin: 1.2px; }"
+			
+			self.meter_reading[device].setStyleSheet(CSS_1+CSS_2)
+			self.meter_reading[device].setValue(0)
 
-				self.power_col.addWidget(self.meter_reading[device])
+			self.addRow(self.power_col, self.meter_reading[device])
 
 
-	@pyqtSlot(list)
-	def updateMeterbar(self, reading):
-		self.meter_reading[reading[0]].setValue(reading[1])
+	@pyqtSlot(dict)
+	def updateMeterbar(self, snapshot):
+		for sample in snapshot.values():
+			if sample.reading.value is not None and sample.device in self.meter_reading:
+				self.meter_reading[sample.device].setValue(int(round(sample.reading.value)))
 
 	@pyqtSlot(list)
 	def updateVoltReading(self, reading):
@@ -1290,12 +1496,22 @@ class heaterUIWindow(QWidget):
 
 	def pauseThread(self):
 		self.meter.pause()
+		self.power.unsubscribe()
+		self.parent.release("heater")
 
 	def startThread(self):
 		self.meter.connected(self.parent.valid_connection)
-		self.meter.itc(self.parent.tc)
+		self.meter.itc(self.parent.io(arbiter.HEATER))
 		self.meter.resume()
 		self.thread.start()
+		if not self.parent.valid_connection:
+			for device in self.meter_reading:
+				self.meter_reading[device].setValue(0)
+			return
+		# shares the VOLT polling of the front panel, no extra instrument traffic
+		for device in self.meter_reading:
+			self.parent.request("heater", device, ["VOLT"], "heater")
+		self.power.subscribe(["%s:RATIO" % device for device in self.meter_reading], constants.POLL_PERIODS["heater"])
 
 	def resumeHomeDisplay(self):
 		self.parent.sensor_display.startThread()
@@ -1306,15 +1522,16 @@ class heaterUIWindow(QWidget):
 	def createThreading(self):
 		self.meter = heaterThread(self)
 		self.thread = QThread(self)
+		self.power = readingBridge(self.parent.bus, self)
 		self.connectThreading()
 
 	def connectThreading(self):
-		self.meter.itc(self.parent.tc)
+		self.meter.itc(self.parent.io(arbiter.HEATER))
 		self.meter.selectDevice(list(self.heater_names.keys()))
 		self.meter.connected(self.parent.valid_connection)
 		self.meter.moveToThread(self.thread)
 		self.thread.started.connect(self.meter.monitorValues)
-		self.meter.signal.connect(self.updateMeterbar)
+		self.power.signal.connect(self.updateMeterbar)
 		self.meter.volt_value.connect(self.updateVoltReading)
 		self.meter.res_value.connect(self.updateResReading)
 		self.meter.ended.connect(self.thread.quit)
@@ -1323,11 +1540,14 @@ class heaterUIWindow(QWidget):
 class sweepTableUIWindow(QWidget):
 
 	control_clicked = pyqtSignal()
+	# sweep table read by refreshSweepTable
+	sweep_read = pyqtSignal(object)
 
 	def __init__(self, parent=None):
 		super(sweepTableUIWindow, self).__init__(parent=parent)
 		self.parent = parent
 		self.SWEEP_ENTRIES = 3	
+		self.sweep_read.connect(self.updateSweepTable)
 		# self.devices = constants.DEVICES
 		# self.sensor_name = constants.SENSORS
 		# layouts
@@ -1365,6 +1585,11 @@ class sweepTableUIWindow(QWidget):
 			self.title_layout.addWidget(self.sweep_titles[title])
 			# self.title_layout.addStretch(1)
 
+		# the loop answers with the name of its sweep table file, not the entries
+		self.sweep_file = QLabel('Sweep file:')
+		self.sweep_file.setStyleSheet('color: white ; font: 12pt; border: 0px')
+		self.title_layout.addWidget(self.sweep_file)
+
 	def createInputs(self):
 		sweep_layout = [QVBoxLayout(), QVBoxLayout(), QVBoxLayout()] 
 
@@ -1419,10 +1644,24 @@ class sweepTableUIWindow(QWidget):
 		self.option_button.getHoverButton().clicked.connect(self.resumeControlDisplay)
 
 	def refreshSweepTable(self):
+		# the table is read on the instrument thread, the GUI is updated when it arrives
 		if self.parent.valid_connection:
-			self.sweep_table = self.parent.tc.get_sweep_table(self.parent.control_display.primary_device)
-			for item in self.sweep_table:
-				self.sweep_values.getFocusLineEdit().setText(str(item))
+			future = self.parent.io(arbiter.PID).submit("get_sweep_table", self.parent.control_display.primary_device)
+			future.add_done_callback(self.sweepTableRead)
+
+	def sweepTableRead(self, future):
+		# runs on the instrument thread
+		try:
+			table = future.result()
+		except Exception:
+			# link down, malformed response or I/O error, the table is read again next time
+			return
+		self.sweep_read.emit(table)
+
+	@pyqtSlot(object)
+	def updateSweepTable(self, table):
+		self.sweep_table = table
+		self.sweep_file.setText('Sweep file: %s' % table)
 
 	def set_sweep_table(self, value, device):
 		self.parent.write.set_sweep_table(value, device)
@@ -1571,12 +1810,174 @@ class pidTableUIWindow(QWidget):
 	handle DB4 update to primary
 	'''
 
+class plotCanvas(QWidget):
+
+	colours = ["gold", "deepskyblue", "orangered", "limegreen"]
+	margin = 60
+
+	def __init__(self, store, panels, parent=None):
+		super(plotCanvas, self).__init__(parent=parent)
+		self.store = store
+		self.panels = panels
+		self.span = list(constants.PLOT_SPANS.values())[0]
+		self.start = self.end = 0.0
+
+		# min/max buckets of each channel, cached between frames
+		self.traces = {}
+		self.frames = {}
+
+		# redraws are capped at PLOT_FPS however fast readings arrive
+		self.timer = QTimer(self)
+		self.timer.setInterval(int(1000 / constants.PLOT_FPS))
+		self.timer.timeout.connect(self.advance)
+
+	def setSpan(self, span):
+		self.span = span
+		self.advance()
+
+	def showEvent(self, event):
+		self.timer.start()
+		self.advance()
+
+	def hideEvent(self, event):
+		self.timer.stop()
+
+	def advance(self):
+		# one bucket per pixel column, only buckets new since the last frame are computed
+		buckets = max(self.width() - self.margin, 1)
+		self.end = time.monotonic()
+		self.start = self.end - self.span
+		for title, channels in self.panels:
+			for channel in channels:
+				ring = self.store.channels.get(channel)
+				if ring is None:
+					continue
+				if channel not in self.traces or self.traces[channel].ring is not ring:
+					# the store reallocates its rings when the channels change
+					self.traces[channel] = history.DecimatedTrace(ring)
+				self.frames[channel] = self.traces[channel].update(self.start, self.end, buckets)
+		self.update()
+
+	def paintEvent(self, event):
+		painter = QPainter(self)
+		painter.fillRect(self.rect(), Qt.black)
+		height = self.height() / len(self.panels)
+		for index, (title, channels) in enumerate(self.panels):
+			box = QRectF(self.margin, index * height + 20, self.width() - self.margin - 5, height - 30)
+			self.drawPanel(painter, box, title, channels)
+		painter.end()
+
+	def drawPanel(self, painter, box, title, channels):
+		frames = [self.frames[channel] for channel in channels if channel in self.frames]
+		lows = [np.nanmin(frame[1]) for frame in frames if not np.isnan(frame[1]).all()]
+		highs = [np.nanmax(frame[2]) for frame in frames if not np.isnan(frame[2]).all()]
+		low = min(lows) if lows else 0.0
+		high = max(highs) if highs else 1.0
+		if high - low < 1e-9:
+			low, high = low - 0.5, high + 0.5
+
+		painter.setPen(QPen(QColor(128, 128, 128)))
+		painter.drawRect(box)
+		painter.drawText(QPointF(box.left() - self.margin + 2, box.top() + 10), "%.4g" % high)
+		painter.drawText(QPointF(box.left() - self.margin + 2, box.bottom()), "%.4g" % low)
+		painter.setPen(QPen(QColor("white")))
+		painter.drawText(QPointF(box.left() + 5, box.top() - 5), title)
+
+		for number, channel in enumerate(channels):
+			if channel not in self.frames:
+				continue
+			colour = QColor(self.colours[number % len(self.colours)])
+			painter.setPen(QPen(colour))
+			painter.drawText(QPointF(box.right() - 110 * (len(channels) - number), box.top() - 5), channel)
+			self.drawTrace(painter, box, self.frames[channel], low, high)
+
+	def drawTrace(self, painter, box, frame, low, high):
+		times, lows, highs = frame
+		x = box.left() + (times - self.start) / (self.end - self.start) * box.width()
+		scale = box.height() / (high - low)
+		y_low = box.bottom() - (lows - low) * scale
+		y_high = box.bottom() - (highs - low) * scale
+
+		# each bucket is a vertical stroke from its max to its min, runs of
+		# filled buckets are joined into one polyline and gaps are left open
+		filled = ~np.isnan(lows) & (x >= box.left())
+		edges = np.flatnonzero(np.diff(np.concatenate(([0], filled.astype(np.int8), [0]))))
+		for first, last in zip(edges[::2], edges[1::2]):
+			points = []
+			for column in range(first, last):
+				points.append(QPointF(x[column], y_high[column]))
+				points.append(QPointF(x[column], y_low[column]))
+			painter.drawPolyline(QPolygonF(points))
+
+
+class plotUIWindow(QWidget):
+
+	home_clicked = pyqtSignal()
+
+	def __init__(self, parent=None):
+		super(plotUIWindow, self).__init__(parent=parent)
+		self.parent = parent
+
+		self.layout = QVBoxLayout()
+		self.setLayout(self.layout)
+		self.setStyleSheet("background-color: black; margin:0px; border:0px solid rgb(128, 128, 128); ")
+
+		self.canvas = plotCanvas(self.parent.history, constants.PLOT_PANELS, self)
+		self.layout.addWidget(self.canvas, 1)
+
+		self.options_layout = QHBoxLayout()
+		self.layout.addLayout(self.options_layout)
+		self.optionButtons()
+
+	def optionButtons(self):
+		self.options_buttons = { "Home" : hoverPushButton("Home") }
+		for label in constants.PLOT_SPANS:
+			self.options_buttons[label] = hoverPushButton(label)
+
+		for label, option in self.options_buttons.items():
+			self.options_layout.addWidget(option.getHoverButton())
+			if label in constants.PLOT_SPANS:
+				option.getHoverButton().clicked.connect(lambda checked, span=constants.PLOT_SPANS[label]: self.canvas.setSpan(span))
+
+		self.options_buttons["Home"].getHoverButton().clicked.connect(self.home_clicked.emit)
+		self.options_buttons["Home"].getHoverButton().clicked.connect(self.resumeHomeDisplay)
+
+	def resumeHomeDisplay(self):
+		self.parent.sensor_display.startThread()
+
+	def startThread(self):
+		# readings come from the front panel thread, which keeps polling
+		self.parent.sensor_display.startThread()
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="Mercury iTC front panel")
+    parser.add_argument("--simulate", action="store_true",
+                        help="run against a simulated iTC, e.g. headless with QT_QPA_PLATFORM=offscreen")
+    parser.add_argument("--data", help="directory of the binary data log every reading is persisted to")
+    # the remaining arguments are Qt options such as -style
+    args, qt_args = parser.parse_known_args()
+
+    app = QApplication(sys.argv[:1] + qt_args)
+
+    resource_manager = None
+    if args.simulate:
+        import simulator
+        resource_manager = simulator.SimulatedResourceManager(latency=0.02, jitter=0.005)
+
+    window = MainWindow(resource_manager=resource_manager)
 
-    window = MainWindow()
+    logger = None
+    if args.data:
+        import datalogger
+        logger = datalogger.DataLogger(args.data)
+        logger.start()
+        window.bus.subscribe(logger.write, replay=False, batch=True)
 
     window.resize(900, 500)
     window.show()
 
-    sys.exit(app.exec_())
\ No newline at end of file
+    status = app.exec_()
+    if logger:
+        logger.stop()
+    sys.exit(status)
\ No newline at end of file
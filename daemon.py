@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Headless acquisition daemon, for logging without a display or Qt, e.g.
+
+    python daemon.py --resource ASRL3::INSTR --log readings.tsv
+    python daemon.py --channel MB1:TEMP@1 --channel DB4:PERC@10 --log -
+    python daemon.py --data /data/cooldown --log /dev/null
+
+The latest readings are served as one JSON document to every client connecting
+to the state port (127.0.0.1:7021 by default). SIGINT and SIGTERM stop the
+daemon cleanly, SIGHUP reopens the log file after it was rotated away.
+"""
+
+
+import acquisition
+import argparse
+import catalog
+import constants
+import json
+import mercuryITC as itc
+import probe
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+
+def parse_channel(text: str) -> tuple:
+    """
+    Parses a channel option, DEVICE:SIGNAL[@PERIOD], e.g. MB1:TEMP@1.0
+
+    Args:
+        text: channel option
+    Returns:
+        device, signal and period (s), the period of the device role if omitted
+    Raises:
+        ValueError: unknown device or invalid period
+    """
+    channel, _, period = text.partition("@")
+    device, _, name = channel.partition(":")
+    if device not in constants.DEVICES:
+        raise ValueError("unknown device %s" % device)
+    role = constants.SENSORS.get(device, ["", "secondary"])[1]
+    return device, name or constants.COMMANDS[device], float(period) if period else constants.POLL_PERIODS[role]
+
+
+def channel_option(text: str) -> str:
+    """
+    Checks the period of a channel option, the argparse type of --channel. The
+    device is checked by parse_channel once the catalog has been discovered.
+
+    Args:
+        text: channel option
+    Returns:
+        the channel option
+    """
+    period = text.partition("@")[2]
+    try:
+        float(period or 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid period %s" % period)
+    return text
+
+
+class LogSink:
+    """
+    Appends readings to a tab separated text file, one line per reading with
+    the wall clock time, channel, value and front panel text
+
+    Attributes:
+        path: log file, - for standard output
+        offset: wall clock minus monotonic time (s)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset = time.time() - time.monotonic()
+        self._lock = threading.Lock()
+        self._file = None
+        self.reopen()
+
+    def reopen(self) -> None:
+        """
+        Opens the log file again, e.g. after logrotate moved it away
+
+        """
+        with self._lock:
+            if self._file not in (None, sys.stdout):
+                self._file.close()
+            self._file = sys.stdout if self.path == "-" else open(self.path, "a")
+
+    def write(self, samples: list) -> None:
+        """
+        Appends one batch of readings
+
+        Args:
+            samples: samples of one acquisition cycle
+        """
+        lines = []
+        for sample in samples:
+            value = "nan" if sample.reading.value is None else repr(sample.reading.value)
+            lines.append("%.3f\t%s\t%s\t%s\n" % (sample.timestamp + self.offset, sample.channel, value,
+                                                 sample.reading.text))
+        with self._lock:
+            self._file.write("".join(lines))
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file not in (None, sys.stdout):
+                self._file.close()
+            self._file = None
+
+
+class _StateHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.wfile.write((json.dumps(self.server.state()) + "\n").encode("ascii"))
+
+
+class StateServer(socketserver.ThreadingTCPServer):
+    """
+    Serves the newest reading of every channel to local clients as JSON
+
+    Attributes:
+        bus: bus the readings are taken from
+        offset: wall clock minus monotonic time (s)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, bus: acquisition.ReadingBus, host: str = "127.0.0.1", port: int = 7021):
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), _StateHandler)
+        self.bus = bus
+        self.offset = time.time() - time.monotonic()
+
+    def state(self) -> dict:
+        """
+        Newest reading of every channel
+
+        Returns:
+            value, unit, text and wall clock time of each channel
+        """
+        return {channel: {"value": sample.reading.value, "unit": sample.reading.unit,
+                          "text": sample.reading.text, "time": sample.timestamp + self.offset}
+                for channel, sample in self.bus.snapshot().items()}
+
+
+def connect(args) -> itc.TemperatureController:
+    if args.simulate:
+        import simulator
+        return itc.TemperatureController(simulator.SimulatedInstrument.resource_name,
+                                         simulator.SimulatedResourceManager())
+    resource = args.resource
+    if not resource:
+        found = probe.probe()
+        resource = probe.reconnect_target(found) or (sorted(found)[0] if found else None)
+        if not resource:
+            raise SystemExit("no Mercury iTC found, use --resource")
+    return itc.TemperatureController(resource)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Headless Mercury iTC acquisition daemon")
+    parser.add_argument("--resource", help="VISA resource, the remembered or first Mercury iTC found if omitted")
+    parser.add_argument("--simulate", action="store_true", help="poll a simulated instrument")
+    parser.add_argument("--channel", action="append", default=[], type=channel_option,
+                        help="DEVICE:SIGNAL[@PERIOD] to poll, the front panel channels if omitted")
+    parser.add_argument("--log", default="-", help="log file, - for standard output")
+    parser.add_argument("--data", help="directory of the binary data log")
+    parser.add_argument("--host", default="127.0.0.1", help="interface of the state server")
+    parser.add_argument("--port", type=int, default=7021, help="port of the state server, 0 to disable")
+    args = parser.parse_args(argv)
+
+    tc = connect(args)
+    try:
+        catalog.discover(tc).install()
+    except Exception:
+        # keep the built-in device tables
+        pass
+
+    try:
+        channels = [parse_channel(text) for text in args.channel] or [
+            (device, constants.COMMANDS[device], constants.POLL_PERIODS[name[1]])
+            for device, name in constants.SENSORS.items()]
+    except ValueError as error:
+        tc.session.close()
+        parser.error(str(error))
+
+    bus = acquisition.ReadingBus()
+    sink = LogSink(args.log)
+    bus.subscribe(sink.write, replay=False, batch=True)
+    logger = None
+    if args.data:
+        # the binary data log is only imported when readings are persisted
+        import datalogger
+        logger = datalogger.DataLogger(args.data)
+        logger.start()
+        bus.subscribe(logger.write, replay=False, batch=True)
+    core = acquisition.AcquisitionCore(tc, bus)
+    for device, name, period in channels:
+        role = constants.SENSORS.get(device, ["", "secondary"])[1]
+        core.request("daemon", device, [name], period, constants.POLL_PRIORITIES[role])
+
+    server = None
+    if args.port:
+        server = StateServer(bus, args.host, args.port)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *args: stop.set())
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda *args: sink.reopen())
+
+    core.start()
+    try:
+        # wake up now and then, signal handlers only run on the main thread
+        while not stop.wait(1.0):
+            pass
+    finally:
+        core.stop()
+        core.join()
+        if server:
+            server.shutdown()
+            server.server_close()
+        sink.close()
+        if logger:
+            logger.stop()
+        tc.session.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,637 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+import json
+import numpy as np
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+
+# one reading on disk: wall clock time (s), value, channel ID and status
+RECORD = np.dtype([("time", "<f8"), ("value", "<f8"), ("channel", "<u4"), ("status", "<u4")])
+
+# record status
+OK = 0
+INVALID = 1
+TEXT = 2
+
+# records per block of the sparse index
+BLOCK = 1024
+
+# records per compressed chunk of an archived segment, a whole number of blocks
+CHUNK = 16 * BLOCK
+
+
+def summarize(records: np.ndarray) -> dict:
+    """
+    Builds the sparse index of a segment: the time span of every block of
+    BLOCK records, and the minimum, maximum, sum and count of the valid values
+    of each channel within each block
+
+    Args:
+        records: records of the segment
+    Returns:
+        first, last (s) per block; block, channel, min, max, sum and count per
+        block and channel present, sorted by block and channel
+    """
+    count = len(records)
+    times = records["time"]
+    first = np.array(times[::BLOCK])
+    last = np.array(times[BLOCK - 1::BLOCK])
+    if count % BLOCK:
+        last = np.append(last, times[-1])
+    valid = np.flatnonzero(records["status"] == OK)
+    keys = (valid // BLOCK).astype(np.int64) << 32 | records["channel"][valid]
+    values = np.array(records["value"][valid])
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = values[order]
+    summary = {"first": first, "last": last}
+    if not len(keys):
+        empty = np.empty(0)
+        return dict(summary, block=empty.astype(np.int64), channel=empty.astype(np.uint32), min=empty,
+                    max=empty, sum=empty, count=empty.astype(np.int64))
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return dict(summary, block=keys[starts] >> 32, channel=(keys[starts] & 0xFFFFFFFF).astype(np.uint32),
+                min=np.minimum.reduceat(values, starts), max=np.maximum.reduceat(values, starts),
+                sum=np.add.reduceat(values, starts), count=np.diff(np.r_[starts, len(keys)]))
+
+
+def _shuffle(column: np.ndarray) -> tuple:
+    # byte planes of similar numbers are alike and compress far better than the
+    # numbers, and planes that are zero throughout are not stored at all
+    column = np.ascontiguousarray(column)
+    planes = column.view(np.uint8).reshape(len(column), column.itemsize).T
+    kept = planes.any(axis=1)
+    return int(np.packbits(kept, bitorder="little")[0]), planes[kept].tobytes()
+
+
+def _unshuffle(data, mask: int, dtype: str, count: int) -> np.ndarray:
+    dtype = np.dtype(dtype)
+    kept = np.unpackbits(np.array([mask], np.uint8), count=dtype.itemsize, bitorder="little").astype(bool)
+    planes = np.zeros((dtype.itemsize, count), np.uint8)
+    planes[kept] = np.frombuffer(data, np.uint8).reshape(int(kept.sum()), count)
+    return planes.T.copy().view(dtype).ravel()
+
+
+def _zigzag(numbers: np.ndarray) -> np.ndarray:
+    # small negative numbers become small positive ones, with zero high bytes
+    return ((numbers << 1) ^ (numbers >> 63)).view("<u8")
+
+
+def _unzigzag(numbers: np.ndarray) -> np.ndarray:
+    return ((numbers >> 1) ^ (np.uint64(0) - (numbers & 1))).view("<i8")
+
+
+def _decimals(values: np.ndarray) -> int:
+    # readings are parsed from front panel text, so most are exact short decimals
+    for decimals in range(10):
+        scaled = np.round(values * 10.0 ** decimals)
+        if np.abs(scaled).max(initial=0.0) >= 2.0 ** 53:
+            break
+        # compared bit for bit as decoded, so e.g. -0.0 is stored verbatim
+        restored = scaled.astype(np.int64) / 10.0 ** decimals
+        if np.array_equal(restored.view("<u8"), values.view("<u8")):
+            return decimals
+    return None
+
+
+# chunk header: first time (us), decimals of the values (XOR if VERBATIM) and
+# the stored byte planes of each column
+_HEADER = struct.Struct("<qB4B")
+_COLUMNS = ("<u8", "<u8", "<u4", "<u4")
+VERBATIM = 255
+
+
+def encode(records: np.ndarray, level: int = 6) -> bytes:
+    """
+    Compresses records column by column: times as delta-of-delta microseconds;
+    values as differences of the scaled integers if they are short decimals,
+    as in the front panel text they were parsed from, otherwise XORed with the
+    previous value (Gorilla style), both per channel; every column is
+    byte-shuffled before zlib. Readings of one poll share a time and slowly
+    changing channels repeat most digits, so both reduce to runs of zero bytes.
+
+    Args:
+        records: records with times kept to the microsecond
+        level: zlib compression level
+    Returns:
+        compressed chunk
+    """
+    micros = np.round(records["time"] * 1e6).astype("<i8")
+    steps = _zigzag(np.diff(np.diff(micros, prepend=micros[0]), prepend=0))
+    order = np.argsort(records["channel"].astype(np.uint16), kind="stable")
+    values = np.ascontiguousarray(records["value"])[order]
+    valid = (records["status"] == OK)[order]
+    decimals = _decimals(values[valid]) if np.isnan(values[~valid]).all() else None
+    if decimals is not None:
+        # invalid readings are NaN, restored from the status
+        scaled = np.where(valid, np.round(values * 10.0 ** decimals), 0.0).astype("<i8")
+        bits = _zigzag(np.diff(scaled, prepend=0))
+    else:
+        decimals = VERBATIM
+        bits = values.view("<u8").copy()
+        bits[1:] ^= bits[:-1].copy()
+    masks, planes = zip(*(_shuffle(column) for column in (steps, bits, records["channel"].astype("<u4"),
+                                                            records["status"].astype("<u4"))))
+    return _HEADER.pack(int(micros[0]), decimals, *masks) + zlib.compress(b"".join(planes), level)
+
+
+def decode(data, count: int) -> np.ndarray:
+    """
+    Decompresses a chunk written by encode(), vectorized throughout
+
+    Args:
+        data: compressed chunk
+        count: number of records in the chunk
+    Returns:
+        records
+    """
+    start, decimals, *masks = _HEADER.unpack(bytes(data[:_HEADER.size]))
+    raw = zlib.decompress(data[_HEADER.size:])
+    columns = []
+    offset = 0
+    for mask, dtype in zip(masks, _COLUMNS):
+        size = bin(mask).count("1") * count
+        columns.append(_unshuffle(raw[offset:offset + size], mask, dtype, count))
+        offset += size
+    steps, bits, channels, status = columns
+    order = np.argsort(channels.astype(np.uint16), kind="stable")
+    values = np.empty(count)
+    if decimals == VERBATIM:
+        values[order] = np.bitwise_xor.accumulate(bits).view("<f8")
+    else:
+        values[order] = np.cumsum(_unzigzag(bits)) / 10.0 ** decimals
+        values[status != OK] = np.nan
+    records = np.empty(count, RECORD)
+    records["time"] = (start + np.cumsum(np.cumsum(_unzigzag(steps)))) / 1e6
+    records["value"] = values
+    records["channel"] = channels
+    records["status"] = status
+    return records
+
+
+class ColumnarSegment:
+    """
+    Archived segment compressed by encode() in chunks of CHUNK records. Slicing
+    decodes only the chunks the slice overlaps, so reading a span costs about
+    the I/O of its compressed chunks.
+
+    Layout:
+        chunks, then a directory of the offset, length and record count of every
+        chunk, then the number of chunks and MAGIC
+
+    Attributes:
+        path: segment file
+        directory: offset, length and record count of every chunk
+    """
+
+    MAGIC = b"MITCCOL1"
+    DIRECTORY = np.dtype([("offset", "<u8"), ("length", "<u8"), ("count", "<u8")])
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = np.memmap(path, np.uint8, "r")
+        trailer = bytes(self._data[-16:])
+        if trailer[8:] != self.MAGIC:
+            raise ValueError("%s is not a columnar segment" % path)
+        end = len(self._data) - 16
+        start = end - int.from_bytes(trailer[:8], "little") * self.DIRECTORY.itemsize
+        self.directory = np.frombuffer(bytes(self._data[start:end]), self.DIRECTORY)
+        self._starts = np.r_[0, np.cumsum(self.directory["count"])].astype(np.int64)
+        self._cached = (None, None)
+
+    @classmethod
+    def write(cls, path: str, records: np.ndarray, level: int = 6) -> None:
+        """
+        Compresses records into a new columnar segment, one chunk at a time
+
+        Args:
+            path: segment file
+            records: records, sorted by time
+            level: zlib compression level
+        """
+        directory = []
+        with open(path + ".tmp", "wb") as output:
+            offset = 0
+            for first in range(0, len(records), CHUNK):
+                chunk = encode(records[first:first + CHUNK], level)
+                output.write(chunk)
+                directory.append((offset, len(chunk), min(CHUNK, len(records) - first)))
+                offset += len(chunk)
+            output.write(np.array(directory, cls.DIRECTORY).tobytes())
+            output.write(len(directory).to_bytes(8, "little") + cls.MAGIC)
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(path + ".tmp", path)
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getitem__(self, key: slice) -> np.ndarray:
+        first, last, step = key.indices(len(self))
+        if last <= first:
+            return np.empty(0, RECORD)
+        low = int(np.searchsorted(self._starts, first, "right")) - 1
+        high = int(np.searchsorted(self._starts, last, "left"))
+        chunks = [self.chunk(number) for number in range(low, high)]
+        records = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        offset = self._starts[low]
+        return records[first - offset:last - offset:step]
+
+    def chunk(self, number: int) -> np.ndarray:
+        """
+        Records of one chunk, the last chunk decoded is kept
+
+        Args:
+            number: chunk number
+        Returns:
+            records
+        """
+        if self._cached[0] != number:
+            offset, length, count = (int(field) for field in self.directory[number])
+            self._cached = (number, decode(self._data[offset:offset + length], count))
+        return self._cached[1]
+
+
+class DataLog:
+    """
+    Directory of append-only segment files of fixed width binary records, with
+    a channel table and an index of the time span of every closed segment.
+    Segments are memory-mapped for reading, so records are never parsed and a
+    window of a multi-week log is a numpy view into the page cache.
+
+    Layout:
+        channels.json   channel name of each channel ID
+        index.json      file, first and last time and record count of closed segments
+        NNNNNNNN.bin    segments, RECORD after RECORD without a header
+        NNNNNNNN.col    closed segments archived by compress(), see ColumnarSegment
+        NNNNNNNN.npz    sparse index of a closed segment, see summarize()
+
+    A time is found by a binary search of the sparse index followed by one of a
+    single block, so a lookup touches a few pages however long the segment is.
+
+    Attributes:
+        path: log directory
+        channels: channel ID of each channel name
+        index: closed segments, oldest first
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.channels = {}
+        self.index = []
+        self._summaries = {}
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Reloads the channel table and the segment index, e.g. while a logger in
+        another process keeps writing
+
+        """
+        names = self._load("channels.json", [])
+        self.channels = {name: number for number, name in enumerate(names)}
+        self.index = self._load("index.json", {"segments": []})["segments"]
+
+    def _load(self, name: str, default):
+        try:
+            with open(os.path.join(self.path, name)) as data:
+                return json.load(data)
+        except (OSError, ValueError):
+            return default
+
+    def _store(self, name: str, data) -> None:
+        # write a new file and swap it in, readers never see a truncated file
+        target = os.path.join(self.path, name)
+        with open(target + ".tmp", "w") as output:
+            json.dump(data, output)
+        os.replace(target + ".tmp", target)
+
+    def channel_id(self, name: str) -> int:
+        """
+        ID of a channel, a new one is assigned to an unknown channel
+
+        Args:
+            name: channel name, e.g. MB1:TEMP
+        Returns:
+            channel ID stored in the records
+        """
+        number = self.channels.get(name)
+        if number is None:
+            number = self.channels[name] = len(self.channels)
+            self._store("channels.json", sorted(self.channels, key=self.channels.get))
+        return number
+
+    def segment_files(self) -> list:
+        """
+        Every segment file including the one being written, oldest first
+
+        Returns:
+            file names
+        """
+        names = set(os.listdir(self.path))
+        # a raw segment left next to its archive while compressing is not read twice
+        return sorted(name for name in names if name.endswith(".col") or
+                      (name.endswith(".bin") and name[:-len(".bin")] + ".col" not in names))
+
+    def open_segment(self, name: str):
+        """
+        Maps the complete records of a segment
+
+        Args:
+            name: segment file name
+        Returns:
+            read-only records, empty if the segment holds no complete record;
+            a ColumnarSegment, sliced like the records, for an archived segment
+        """
+        path = os.path.join(self.path, name)
+        if name.endswith(".col"):
+            return ColumnarSegment(path)
+        # a record torn by a crash or still being written is left out
+        count = os.path.getsize(path) // RECORD.itemsize
+        if not count:
+            return np.empty(0, RECORD)
+        return np.memmap(path, RECORD, "r", shape=(count,))
+
+    def summary(self, name: str) -> dict:
+        """
+        Sparse index of a closed segment, built and stored if it is missing
+
+        Args:
+            name: segment file name
+        Returns:
+            see summarize(), None for the segment being written
+        """
+        base = name.split(".")[0]
+        if base in self._summaries:
+            return self._summaries[base]
+        try:
+            with np.load(os.path.join(self.path, base + ".npz")) as data:
+                summary = dict(data)
+        except (OSError, ValueError):
+            if name not in {entry["file"] for entry in self.index}:
+                return None
+            summary = self.index_segment(name)
+        self._summaries[base] = summary
+        return summary
+
+    def index_segment(self, name: str) -> dict:
+        """
+        Builds and stores the sparse index of a closed segment
+
+        Args:
+            name: segment file name
+        Returns:
+            see summarize()
+        """
+        base = name.split(".")[0]
+        summary = summarize(self.open_segment(name)[:])
+        target = os.path.join(self.path, base + ".npz")
+        try:
+            with open(target + ".tmp", "wb") as output:
+                np.savez(output, **summary)
+            os.replace(target + ".tmp", target)
+        except OSError:
+            # a read-only log is indexed in memory only
+            pass
+        self._summaries[base] = summary
+        return summary
+
+    def compress(self, name: str) -> str:
+        """
+        Archives a closed raw segment as a ColumnarSegment. The raw segment is
+        left in place, the caller removes it once the index names the archive.
+
+        Args:
+            name: raw segment file name
+        Returns:
+            archive file name
+        """
+        archive = name.split(".")[0] + ".col"
+        ColumnarSegment.write(os.path.join(self.path, archive), self.open_segment(name)[:])
+        for entry in self.index:
+            if entry["file"] == name:
+                entry["file"] = archive
+        return archive
+
+    def store_index(self) -> None:
+        """
+        Writes the segment index
+
+        """
+        self._store("index.json", {"version": self.VERSION, "segments": self.index})
+
+    def locate(self, name: str, records: np.ndarray, when: float) -> int:
+        """
+        Position of the first record at or after a time
+
+        Args:
+            name: segment file name
+            records: records of the segment
+            when: wall clock time
+        Returns:
+            record index, len(records) if every record is earlier
+        """
+        summary = self.summary(name)
+        # the segment being written has no stored index, a strided read builds one
+        sparse = summary["first"] if summary is not None else np.array(records["time"][::BLOCK])
+        block = max(int(np.searchsorted(sparse, when, "left")) - 1, 0)
+        times = np.array(records[block * BLOCK:(block + 1) * BLOCK]["time"])
+        return block * BLOCK + int(np.searchsorted(times, when, "left"))
+
+    def slices(self, start: float = None, end: float = None) -> list:
+        """
+        Record ranges of the segments overlapping a time span
+
+        Args:
+            start: earliest wall clock time, from the first record if None
+            end: wall clock time after the span, up to the last record if None
+        Returns:
+            segment name, records as returned by open_segment() and the first and
+            last (exclusive) record index with start <= time < end, one tuple per segment
+        """
+        closed = {entry["file"]: entry for entry in self.index}
+        found = []
+        for name in self.segment_files():
+            entry = closed.get(name)
+            # the index skips closed segments outside the span without opening them
+            if entry and ((start is not None and entry["last"] < start) or (end is not None and entry["first"] >= end)):
+                continue
+            records = self.open_segment(name)
+            if not len(records):
+                continue
+            first = 0 if start is None else self.locate(name, records, start)
+            last = len(records) if end is None else self.locate(name, records, end)
+            if last > first:
+                found.append((name, records, first, last))
+        return found
+
+    def segments(self, start: float = None, end: float = None) -> list:
+        """
+        Records of the segments overlapping a time span, without copying raw
+        segments
+
+        Args:
+            start: earliest wall clock time, from the first record if None
+            end: wall clock time after the span, up to the last record if None
+        Returns:
+            records with start <= time < end, one array per segment
+        """
+        return [records[first:last] for name, records, first, last in self.slices(start, end)]
+
+    def read(self, start: float = None, end: float = None, channel: str = None) -> np.ndarray:
+        """
+        Records of a time span, optionally of one channel
+
+        Args:
+            start: earliest wall clock time, from the first record if None
+            end: wall clock time after the span, up to the last record if None
+            channel: channel name, every channel if None
+        Returns:
+            records, a view when the span lies in one segment and no channel is selected
+        """
+        views = self.segments(start, end)
+        records = views[0] if len(views) == 1 else np.concatenate(views) if views else np.empty(0, RECORD)
+        if channel is not None:
+            records = records[records["channel"] == self.channels.get(channel, -1)]
+        return records
+
+
+class DataLogger(threading.Thread):
+    """
+    Pipeline stage that persists readings from a ReadingBus into a DataLog.
+    write() only queues the batch, so the acquisition loop never waits for the
+    disk; a background thread converts batches to records and appends them.
+    When the bounded queue is full the batch is dropped and counted instead.
+
+    Segments are rotated when they reach a size or an age, and the index entry
+    of a segment is written when it is closed. The segment being written stays
+    raw, so it survives a crash and can be read live; closed segments are
+    archived as compressed ColumnarSegments, chunk by chunk on the logger thread.
+
+    Attributes:
+        log: data log written to
+        max_bytes: segment size that starts a new segment
+        max_age: segment age (s) that starts a new segment
+        flush_interval: longest time (s) records stay in the write buffer
+        compress: archive closed segments compressed
+        dropped: number of samples dropped because the queue was full
+        written: number of records written
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 ** 2, max_age: float = 24 * 3600.0,
+                 flush_interval: float = 1.0, queue_size: int = 1024, compress: bool = True):
+        threading.Thread.__init__(self, name="DataLogger", daemon=True)
+        self.log = DataLog(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.dropped = 0
+        self.written = 0
+        # readings carry monotonic time, the log stores wall clock time
+        self.offset = time.time() - time.monotonic()
+        self._queue = queue.Queue(queue_size)
+        self._file = None
+        self._segment = None
+
+    def write(self, samples: list) -> None:
+        """
+        Queues a batch of readings, never blocks
+
+        Args:
+            samples: samples of one acquisition cycle
+        """
+        try:
+            self._queue.put_nowait(samples)
+        except queue.Full:
+            self.dropped += len(samples)
+
+    def stop(self) -> None:
+        """
+        Writes out the queued readings, closes the segment and ends the thread
+
+        """
+        self._queue.put(None)
+        self.join()
+
+    def run(self) -> None:
+        flushed = time.monotonic()
+        while True:
+            try:
+                samples = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                samples = []
+            if samples is None:
+                break
+            if samples:
+                self._append(self.records(samples))
+            if self._file and time.monotonic() - flushed >= self.flush_interval:
+                self._file.flush()
+                flushed = time.monotonic()
+        self._close()
+
+    def records(self, samples: list) -> np.ndarray:
+        """
+        Converts readings to records
+
+        Args:
+            samples: samples to convert
+        Returns:
+            one record per sample
+        """
+        records = np.empty(len(samples), RECORD)
+        for row, sample in enumerate(samples):
+            value = sample.reading.value
+            status = INVALID if sample.reading.text == "INVALID" else TEXT if value is None else OK
+            # times are kept to the microsecond, which archives store exactly
+            records[row] = (round(sample.timestamp + self.offset, 6), np.nan if value is None else value,
+                            self.log.channel_id(sample.channel), status)
+        return records
+
+    def _append(self, records: np.ndarray) -> None:
+        if self._segment and (self._segment["bytes"] >= self.max_bytes or
+                              records["time"][0] - self._segment["first"] >= self.max_age):
+            self._close()
+        if self._segment is None:
+            self._open(records["time"][0])
+        self._file.write(records.tobytes())
+        self._segment["bytes"] += records.nbytes
+        self._segment["last"] = float(records["time"][-1])
+        self.written += len(records)
+
+    def _open(self, first: float) -> None:
+        files = self.log.segment_files()
+        number = int(files[-1].split(".")[0]) + 1 if files else 0
+        name = "%08d.bin" % number
+        self._file = open(os.path.join(self.log.path, name), "ab")
+        self._segment = {"file": name, "first": float(first), "last": float(first), "bytes": 0}
+
+    def _close(self) -> None:
+        if self._file is None:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        segment = self._segment
+        self.log.index.append({"file": segment["file"], "first": segment["first"], "last": segment["last"],
+                               "records": segment["bytes"] // RECORD.itemsize})
+        # the sparse index goes first, a reader finding the entry finds the index too
+        self.log.index_segment(segment["file"])
+        if self.compress:
+            self.log.compress(segment["file"])
+        self.log.store_index()
+        if self.compress:
+            os.remove(os.path.join(self.log.path, segment["file"]))
+        self._file = None
+        self._segment = None
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+import numpy as np
+import time
+
+
+class RingBuffer:
+    """
+    Fixed size ring of (monotonic timestamp, value) samples. Every sample is
+    stored twice, at i and i + capacity, so the newest samples are always one
+    contiguous slice and windows are returned as numpy views without copying.
+
+    Appends come from a single writer; a reader sees every sample appended
+    before its call.
+
+    Attributes:
+        capacity: number of samples kept
+    """
+
+    # bytes per sample: float64 timestamp and value, each stored twice
+    SAMPLE_BYTES = 32
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        # pages are only committed by the OS once samples are written to them
+        self._times = np.empty(2 * capacity)
+        self._values = np.empty(2 * capacity)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, value: float, timestamp: float = None) -> None:
+        """
+        Adds a sample, dropping the oldest one when the ring is full
+
+        Args:
+            value: sample value
+            timestamp: monotonic time of the sample, now if None
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        index = self._next
+        self._times[index] = self._times[index + self.capacity] = timestamp
+        self._values[index] = self._values[index + self.capacity] = value
+        self._next = (index + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def _span(self) -> tuple:
+        end = self._next + self.capacity
+        return end - self._count, end
+
+    def view(self) -> tuple:
+        """
+        All samples in the ring, oldest first
+
+        Returns:
+            timestamps and values as read-only numpy views
+        """
+        start, end = self._span()
+        return self._readonly(start, end)
+
+    def window(self, start: float = None, end: float = None) -> tuple:
+        """
+        Samples with start <= timestamp < end, oldest first
+
+        Args:
+            start: earliest monotonic time, from the oldest sample if None
+            end: monotonic time after the window, up to the newest sample if None
+        Returns:
+            timestamps and values as read-only numpy views
+        """
+        oldest, newest = self._span()
+        times = self._times[oldest:newest]
+        first = oldest + (0 if start is None else int(np.searchsorted(times, start, "left")))
+        last = newest if end is None else oldest + int(np.searchsorted(times, end, "left"))
+        return self._readonly(first, max(first, last))
+
+    def latest(self) -> tuple:
+        """
+        Newest sample
+
+        Returns:
+            timestamp and value, None if the ring is empty
+        """
+        if not self._count:
+            return None
+        index = self._next - 1 + self.capacity
+        return self._times[index], self._values[index]
+
+    def _readonly(self, start: int, end: int) -> tuple:
+        times = self._times[start:end]
+        values = self._values[start:end]
+        times.flags.writeable = False
+        values.flags.writeable = False
+        return times, values
+
+
+class HistoryStore:
+    """
+    In-memory time series of every front panel channel, e.g. MB1, DB6, DB4, MB0,
+    DB1 and the heater power ratios MB0:RATIO and DB1:RATIO. Each channel is a
+    preallocated RingBuffer, so memory use is fixed up front and appends are O(1).
+
+    Attributes:
+        capacity: number of samples kept per channel
+        channels: ring buffer of each channel
+    """
+
+    def __init__(self, capacity: int, channels=()):
+        self.capacity = capacity
+        self.channels = {}
+        for channel in channels:
+            self.add(channel)
+
+    @classmethod
+    def for_budget(cls, budget: int, channels: list) -> "HistoryStore":
+        """
+        Creates a store whose channels share a fixed memory budget
+
+        Args:
+            budget: memory for all samples (bytes)
+            channels: channel names
+        Returns:
+            store with the largest capacity that fits the budget
+        """
+        return cls(cls._capacity(budget, channels), channels)
+
+    @staticmethod
+    def _capacity(budget: int, channels: list) -> int:
+        return max(budget // (RingBuffer.SAMPLE_BYTES * max(len(channels), 1)), 1)
+
+    def fit(self, budget: int, channels: list) -> None:
+        """
+        Shares a fixed memory budget between a new set of channels, e.g. the ones
+        of a discovered instrument. Channels that are not listed are dropped and
+        the newest samples of the others are kept, as many as the new capacity allows.
+
+        Args:
+            budget: memory for all samples (bytes)
+            channels: channel names
+        """
+        capacity = self._capacity(budget, channels)
+        if capacity == self.capacity and set(channels) == set(self.channels):
+            return
+        previous = self.channels
+        self.capacity = capacity
+        self.channels = {}
+        for channel in channels:
+            ring = self.add(channel)
+            if channel in previous:
+                times, values = previous[channel].view()
+                for timestamp, value in zip(times[-capacity:], values[-capacity:]):
+                    ring.append(value, timestamp)
+
+    def add(self, channel: str) -> RingBuffer:
+        """
+        Allocates the ring buffer of a channel
+
+        Args:
+            channel: channel name
+        Returns:
+            ring buffer of the channel
+        """
+        if channel not in self.channels:
+            self.channels[channel] = RingBuffer(self.capacity)
+        return self.channels[channel]
+
+    def append(self, channel: str, value: float, timestamp: float = None) -> None:
+        """
+        Adds a sample to a channel
+
+        Args:
+            channel: channel name
+            value: sample value
+            timestamp: monotonic time of the sample, now if None
+        """
+        self.add(channel).append(value, timestamp)
+
+    def window(self, channel: str, start: float = None, end: float = None) -> tuple:
+        """
+        Samples of a channel with start <= timestamp < end
+
+        Args:
+            channel: channel name
+            start: earliest monotonic time, from the oldest sample if None
+            end: monotonic time after the window, up to the newest sample if None
+        Returns:
+            timestamps and values as read-only numpy views
+        """
+        return self.channels[channel].window(start, end)
+
+    def latest(self, channel: str) -> tuple:
+        """
+        Newest sample of a channel
+
+        Args:
+            channel: channel name
+        Returns:
+            timestamp and value, None if the channel is empty
+        """
+        ring = self.channels.get(channel)
+        return ring.latest() if ring else None
+
+
+def minmax_buckets(times: np.ndarray, values: np.ndarray, start: float, width: float, count: int) -> tuple:
+    """
+    Reduces samples to the minimum and maximum of fixed width time buckets, the
+    level of detail a plot with one bucket per pixel column needs
+
+    Args:
+        times: sorted sample timestamps
+        values: sample values
+        start: start time of the first bucket
+        width: bucket width (s)
+        count: number of buckets
+    Returns:
+        minimum and maximum of each bucket, NaN for empty buckets
+    """
+    lows = np.full(count, np.nan)
+    highs = np.full(count, np.nan)
+    cuts = np.searchsorted(times, start + width * np.arange(count + 1), "left")
+    filled = cuts[:-1] < cuts[1:]
+    if filled.any():
+        # empty buckets add no samples between the filled ones they separate
+        starts = cuts[:-1][filled]
+        samples = values[:cuts[-1]]
+        lows[filled] = np.minimum.reduceat(samples, starts)
+        highs[filled] = np.maximum.reduceat(samples, starts)
+    return lows, highs
+
+
+class DecimatedTrace:
+    """
+    Min/max decimation of one channel that is updated incrementally. Buckets are
+    aligned to multiples of their width, so as the plot scrolls only the newest
+    (possibly partial) bucket and the buckets after it are recomputed; the cost
+    of a frame depends on the pixel width, not on the length of the history.
+
+    Attributes:
+        ring: ring buffer of the channel
+        width: bucket width (s) of the cached buckets
+    """
+
+    def __init__(self, ring: RingBuffer):
+        self.ring = ring
+        self.width = None
+        self._first = 0
+        self._lows = np.empty(0)
+        self._highs = np.empty(0)
+
+    def update(self, start: float, end: float, buckets: int) -> tuple:
+        """
+        Decimates the samples of a time span
+
+        Args:
+            start: monotonic time at the left edge of the plot
+            end: monotonic time at the right edge of the plot
+            buckets: number of buckets, usually the plot width in pixels
+        Returns:
+            bucket start times, minimum and maximum of each bucket
+        """
+        width = (end - start) / buckets
+        first = int(np.floor(start / width))
+        last = int(np.floor(end / width))
+        if width != self.width:
+            self.width = width
+            self._first = first
+            self._lows = np.empty(0)
+            self._highs = np.empty(0)
+
+        # reuse the cached buckets still in view except the newest, which may
+        # have been partial; recompute everything after them
+        offset = first - self._first
+        complete = self._first + len(self._lows) - 1
+        keep = max(min(complete, last + 1) - first, 0) if offset >= 0 else 0
+        lows = self._lows[offset:offset + keep]
+        highs = self._highs[offset:offset + keep]
+        fresh = last - first + 1 - keep
+        times, values = self.ring.window((first + keep) * width, (last + 1) * width)
+        new_lows, new_highs = minmax_buckets(times, values, (first + keep) * width, width, fresh)
+
+        self._first = first
+        self._lows = np.concatenate((lows, new_lows))
+        self._highs = np.concatenate((highs, new_highs))
+        return (first + np.arange(len(self._lows))) * width, self._lows, self._highs
@@ -4,11 +4,683 @@
 
 
 from constants import DEVICES
+from typing import NamedTuple
 import pyvisa as visa
+import math
+import random
 import serial
 import time
 
 
+class MalformedResponse(ValueError):
+    """
+    Raised when a response frame is not a well formed STAT: line for the command
+    that was sent
+    """
+
+
+class FramingError(MalformedResponse):
+    """
+    Raised when a response is not one complete line of printable ASCII, i.e. it
+    was cut short or garbled on the wire
+    """
+
+
+class LinkDown(ConnectionError):
+    """
+    Raised without touching the port while the circuit breaker of a session is
+    open, i.e. after repeated transactions failed on a dead link, and after the
+    session was closed
+    """
+
+
+class Reading(NamedTuple):
+    """
+    One value read from the device, e.g. 4.2130K
+
+    Attributes:
+        value: number read, None for text values such as VALID or ON
+        unit: unit following the number, e.g. K, V, %
+        text: value as sent by the device
+    """
+    value: float
+    unit: str
+    text: str
+
+
+# bytes that may trail a number as its unit
+_UNIT = frozenset(b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ%")
+_NUMBER = frozenset(b"0123456789+-.")
+
+
+def parse_value(field: bytes, strict: bool = True) -> Reading:
+    """
+    Splits a value field into number and unit, e.g. b"4.2130K", b"35.0%", b"VALID"
+
+    Args:
+        field: value field of a response
+        strict: reject fields that start like a number but are not one
+    Returns:
+        typed reading
+    """
+    split = len(field)
+    while split and field[split - 1] in _UNIT:
+        split -= 1
+    text = field.decode("ascii")
+    if not split or field[0] not in _NUMBER:
+        return Reading(None, "", text)
+    try:
+        # float() parses bytes directly, without a str copy
+        return Reading(float(field[:split]), text[split:], text)
+    except ValueError:
+        if strict:
+            raise MalformedResponse("garbled value %r" % field)
+        return Reading(None, "", text)
+
+
+def parse_response(raw: bytes, echo: bytes = None) -> Reading:
+    """
+    Parses a single value response, e.g. b"STAT:DEV:MB1.T1:TEMP:SIG:TEMP:4.2130K\n"
+
+    Args:
+        raw: unmodified bytes sent back by the device
+        echo: command path the device must echo after STAT:, not checked if None
+    Returns:
+        typed reading of the last field
+    """
+    end = len(raw)
+    while end and raw[end - 1] in b"\r\n":
+        end -= 1
+    if echo is not None and not (raw.startswith(b"STAT:") and raw.startswith(echo, 5)):
+        raise MalformedResponse("unexpected response %r" % raw)
+    colon = raw.rfind(b":", 0, end)
+    if colon < 0 or colon == end - 1:
+        raise MalformedResponse("no value in %r" % raw)
+    # only STAT: frames are known to carry numbers, e.g. *IDN? ends in a version
+    return parse_value(raw[colon + 1:end], echo is not None)
+
+
+def parse_signals(raw: bytes, path: bytes, signals: list) -> dict:
+    """
+    Splits a combined STAT: response into a reading of each requested signal,
+    e.g. STAT:DEV:MB1.T1:TEMP:SIG:TEMP:4.2130K:SIG:VOLT:0.1023V
+
+    Args:
+        raw: unmodified bytes sent back for a multi-signal READ command
+        path: device path the device must echo after STAT:
+        signals: read commands in the order they were requested
+    Returns:
+        typed reading of each signal, None when the signal is missing
+    """
+    if not (raw.startswith(b"STAT:") and raw.startswith(path, 5)):
+        raise MalformedResponse("unexpected response %r" % raw)
+    tokens = raw[5 + len(path):].rstrip(b"\r\n").split(b":")
+    wanted = {signal.encode("ascii"): signal for signal in signals}
+    values = dict.fromkeys(signals)
+    index = 0
+    while index < len(tokens) - 1:
+        # accepts both SIG:TEMP:<value>:SIG:VOLT:<value> and SIG:TEMP:<value>:VOLT:<value>
+        if tokens[index] in (b"", b"SIG"):
+            index += 1
+            continue
+        signal = wanted.get(tokens[index])
+        if signal and values[signal] is None:
+            values[signal] = parse_value(tokens[index + 1])
+        index += 2
+    return values
+
+
+INVALID = Reading(None, "", "INVALID")
+
+# every byte that may appear in a response line
+_PRINTABLE = bytes(range(32, 127))
+
+
+def check_frame(raw: bytes, termination: bytes = b"\n") -> bytes:
+    """
+    Checks that a response is exactly one complete line, e.g. that the device
+    did not stop mid-line or send line noise
+
+    Args:
+        raw: unmodified bytes of one response
+        termination: bytes ending every response
+    Returns:
+        raw, unchanged
+    """
+    if not raw.endswith(termination):
+        raise FramingError("short frame %r" % raw)
+    # a carriage return may precede the line feed
+    if raw[:-len(termination)].rstrip(b"\r").translate(None, _PRINTABLE):
+        raise FramingError("garbled frame %r" % raw)
+    return raw
+
+
+def parse_catalog(raw: bytes) -> list:
+    """
+    Splits a SYS:CAT response into device paths, e.g.
+    STAT:SYS:CAT:DEV:MB1.T1:TEMP:DEV:MB0.H1:HTR
+
+    Args:
+        raw: unmodified bytes sent back for READ:SYS:CAT
+    Returns:
+        device paths, e.g. ["DEV:MB1.T1:TEMP", "DEV:MB0.H1:HTR"]
+    """
+    if not raw.startswith(b"STAT:SYS:CAT"):
+        raise MalformedResponse("unexpected response %r" % raw)
+    tokens = raw[12:].rstrip(b"\r\n").split(b":")
+    paths = []
+    index = 0
+    while index < len(tokens) - 2:
+        if tokens[index] == b"DEV":
+            paths.append("DEV:%s:%s" % (tokens[index + 1].decode("ascii"), tokens[index + 2].decode("ascii")))
+            index += 3
+        else:
+            index += 1
+    return paths
+
+
+class RetryPolicy:
+    """
+    How a session retries failed transactions. Retries back off exponentially
+    with random jitter, so callers sharing a link do not retry in lockstep. A
+    run of failed transactions opens the circuit breaker: transactions then fail
+    at once with LinkDown until the cooldown is over, when a single trial
+    transaction, without retries, decides whether the link is back.
+
+    Attributes:
+        attempts: tries per transaction, including the first
+        base: delay (s) before the first retry, doubled for every further one
+        cap: longest delay (s) between two tries
+        jitter: largest random extra delay, as a fraction of the delay
+        threshold: consecutive failed transactions that open the breaker
+        cooldown: time (s) the breaker stays open
+    """
+
+    def __init__(self, attempts: int = 3, base: float = 0.05, cap: float = 1.0, jitter: float = 0.5,
+                 threshold: int = 3, cooldown: float = 5.0, sleep=time.sleep, clock=time.monotonic):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.sleep = sleep
+        self.clock = clock
+
+    def delay(self, retry: int) -> float:
+        """
+        Time to wait before a retry
+
+        Args:
+            retry: number of the retry, 0 for the first
+        Returns:
+            delay (s)
+        """
+        delay = min(self.cap, self.base * 2 ** retry)
+        return delay * (1.0 + self.jitter * random.random())
+
+
+class Pacer:
+    """
+    Learns the shortest safe gap between transactions on a link with additive
+    increase, multiplicative decrease of the command rate: every clean answer
+    shortens the gap, while a timeout or congestion doubles it. An INVALID is
+    rushed when it clears on the retry or answers a command the instrument
+    accepted before. Congestion is a run of rushed INVALIDs too long to happen
+    by chance at the background rate of the link, so an instrument rejecting
+    some commands whatever the gap does not slow the link down. Above the last
+    congested gap the gap closes in quickly and it then stays there, so it
+    settles just above the point where the instrument starts rejecting
+    commands, instead of a fixed sleep sized for the slowest cryostat. The
+    limit is lowered by one step for every while without congestion, in case
+    the instrument has become faster.
+
+    Attributes:
+        gap: current gap (s) between the end of one transaction and the next
+        floor: shortest gap (s)
+        ceiling: longest gap (s)
+        step: amount (s) a clean answer takes off the gap
+        factor: multiplier applied to the gap on congestion
+        limit: gap (s) just above the last congested one, the gap never shrinks below it
+        memory: time (s) without congestion after which the limit is lowered by one step
+        drift: weight of the newest try in the background INVALID rate
+        noise: background rate below which INVALIDs are taken as noise
+        tolerance: chance of mistaking a run of background INVALIDs for congestion
+        patience: longest run of rushed INVALIDs taken as background
+        background: rate of rushed INVALIDs per answered try outside congestion
+        waited: total time (s) spent waiting for the gap
+        backoffs: number of times the gap was widened
+    """
+
+    def __init__(self, gap: float = 0.0, floor: float = 0.0, ceiling: float = 1.0, step: float = 0.002,
+                 factor: float = 2.0, memory: float = 60.0, drift: float = 0.01,
+                 noise: float = 0.05, tolerance: float = 0.001, patience: int = 10, sleep=time.sleep,
+                 clock=time.monotonic):
+        self.gap = gap
+        self.floor = floor
+        self.ceiling = ceiling
+        self.step = step
+        self.factor = factor
+        self.limit = floor
+        self.memory = memory
+        self.drift = drift
+        self.noise = noise
+        self.tolerance = tolerance
+        self.patience = patience
+        self.background = 0.0
+        self.sleep = sleep
+        self.clock = clock
+        self.waited = 0.0
+        self.backoffs = 0
+        self._limited = None
+        self._run = 0
+        self._settled = 0.0
+        self._last = None
+
+    def wait(self) -> None:
+        """
+        Waits until the gap since the last transaction has passed
+
+        """
+        if self._last is not None:
+            remaining = self._last + self.gap - self.clock()
+            if remaining > 0:
+                self.waited += remaining
+                self.sleep(remaining)
+
+    def done(self) -> None:
+        """
+        Marks the end of a transaction, answered or not
+
+        """
+        self._last = self.clock()
+
+    def answered(self, rushed: bool, clean: bool) -> None:
+        """
+        Adapts the gap to one answered try
+
+        Args:
+            rushed: the instrument rejected a command that was sent too soon
+            clean: every command was answered on the first try
+        """
+        self.background += self.drift * (rushed - self.background)
+        if not rushed:
+            self._run = 0
+            self._settled = self.background
+            if clean:
+                self.relax()
+            return
+        self._run += 1
+        # the shortest run that background INVALIDs make only once in 1 / tolerance tries
+        usual = min(max(self._settled, self.noise), 0.9)
+        if self._run >= min(self.patience, max(2, math.ceil(math.log(self.tolerance) / math.log(usual)))):
+            # the run was caused by the gap and is no part of the background
+            self.background = self._settled
+            self.backoff()
+
+    def relax(self) -> None:
+        """
+        Shortens the gap after a clean answer, down to the limit
+
+        """
+        if self.limit > self.floor and self.clock() - self._limited >= self.memory:
+            # the instrument may have become faster since the last congestion
+            self.limit = max(self.floor, self.limit - self.step)
+            self._limited = self.clock()
+        if self.gap > self.limit:
+            # a gap above the limit is known to be too wide, halve the difference
+            self.gap = max(self.limit, self.gap - max(self.step, (self.gap - self.limit) / 2))
+
+    def backoff(self, rejected: bool = True) -> None:
+        """
+        Widens the gap after the instrument showed it was sent commands too fast
+
+        Args:
+            rejected: the instrument answered INVALID; a timeout may as well
+                be a dead link and does not move the limit
+        """
+        self.backoffs += 1
+        if rejected:
+            # the rejected gap plus one step is taken as safe
+            self.limit = min(self.ceiling, self.gap + self.step)
+            self._limited = self.clock()
+        # from zero the gap has to grow by at least one step
+        self.gap = min(self.ceiling, max(self.gap * self.factor, self.gap + self.step))
+
+
+class VisaSession:
+    """
+    Connection lifecycle for a single VISA resource. One session is kept open for
+    the lifetime of the controller and stale input is discarded before every
+    transaction. Failed transactions are retried as the RetryPolicy says: after
+    a timeout the port is left open, after a transport error it is reopened, and
+    INVALID answers are retried only where the caller asks for it. Every try is
+    paced by the Pacer of the link.
+
+    Commands and responses are framed by the termination characters configured
+    on the resource, so a read returns as soon as the line is complete instead
+    of waiting for a timeout, and every response is checked to be one whole
+    line before it is passed on.
+
+    Attributes:
+        resource: VISA resource name, e.g. ASRL3::INSTR
+        instrument: open pyvisa resource
+        policy: retry, backoff and circuit breaker settings
+        pacer: adaptive gap between transactions
+        transactions: number of completed transactions
+        invalid: number of INVALID responses
+        malformed: number of responses that could not be parsed
+        retries: number of transactions reissued after a failure
+        reconnects: number of times the port was reopened
+        timeouts: number of tries that timed out
+        framing: number of tries that got a short or garbled response
+        errors: number of tries that failed with a transport error
+        trips: number of times the circuit breaker opened
+        rejected: number of transactions refused while the breaker was open
+        closed: whether the session was closed for good, it then never reopens
+    """
+
+    DISCARD = visa.constants.VI_READ_BUF_DISCARD | visa.constants.VI_IO_IN_BUF_DISCARD
+    WRITE_TERMINATION = "\n\r"
+    READ_TERMINATION = "\n"
+    # commands remembered as accepted, to tell a rushed INVALID from a wrong command
+    ANSWERED = 4096
+
+    def __init__(self, resource, resource_manager=None, policy: RetryPolicy = None, pacer: Pacer = None):
+        self.resource = resource
+        self.resource_manager = resource_manager or visa.ResourceManager()
+        self.policy = policy or RetryPolicy()
+        self.pacer = pacer or Pacer()
+        self.instrument = None
+        self.transactions = 0
+        self.invalid = 0
+        self.malformed = 0
+        self.retries = 0
+        self.reconnects = 0
+        self.timeouts = 0
+        self.framing = 0
+        self.errors = 0
+        self.trips = 0
+        self.rejected = 0
+        self.failures = 0
+        self.opened = None
+        self._answered = set()
+        self.closed = False
+        self.connect()
+
+    def connect(self) -> None:
+        """
+        Opens the session to the resource, framed by the termination characters
+
+        """
+        self.closed = False
+        self.instrument = self.resource_manager.open_resource(self.resource)
+        self.instrument.write_termination = self.WRITE_TERMINATION
+        self.instrument.read_termination = self.READ_TERMINATION
+
+    def reconnect(self) -> None:
+        """
+        Drops the current session and opens a new one, unless it was closed
+
+        """
+        if self.closed:
+            # another session may own the port by now
+            raise LinkDown("session to %s was closed" % self.resource)
+        self.reconnects += 1
+        self._drop()
+        self.connect()
+
+    def close(self) -> None:
+        """
+        Closes the session for good, a transaction still in flight fails
+        instead of reopening the port
+
+        """
+        self.closed = True
+        self._drop()
+
+    def _drop(self) -> None:
+        # errors from an already broken link are ignored
+        try:
+            self.instrument.close()
+        except (visa.errors.Error, serial.serialutil.SerialException):
+            pass
+
+    def clear(self) -> None:
+        """
+        Discards any unread bytes left over from an earlier transaction
+
+        """
+        try:
+            self.instrument.flush(self.DISCARD)
+        except (visa.errors.VisaIOError, NotImplementedError):
+            pass
+
+    @staticmethod
+    def is_io_error(error: Exception) -> bool:
+        """
+        Checks whether an exception means the link itself is broken
+
+        Args:
+            error: exception raised by pyvisa or pyserial
+        Returns:
+            True for errors that need the port to be reopened
+        """
+        if isinstance(error, visa.errors.VisaIOError):
+            return error.error_code != visa.constants.StatusCode.error_timeout
+        return isinstance(error, (visa.errors.InvalidSession, serial.serialutil.SerialException))
+
+    @staticmethod
+    def is_timeout(error: Exception) -> bool:
+        """
+        Checks whether an exception is a read or write timeout
+
+        Args:
+            error: exception raised by pyvisa
+        Returns:
+            True for timeouts, the link may still be fine
+        """
+        return isinstance(error, visa.errors.VisaIOError) and error.error_code == visa.constants.StatusCode.error_timeout
+
+    @property
+    def link_down(self) -> bool:
+        """
+        Whether the circuit breaker is open and transactions fail at once
+        """
+        return self.opened is not None and self.policy.clock() - self.opened < self.policy.cooldown
+
+    def query(self, command: str, retry_invalid: bool = False, retry_rushed: bool = False) -> bytes:
+        """
+        Writes a command and reads the raw response on the open session
+
+        Args:
+            command: command line without termination
+            retry_invalid: retry while the instrument answers INVALID
+            retry_rushed: retry once if the instrument answers INVALID
+        Returns:
+            unmodified bytes sent back by the instrument
+        """
+        return self.exchange([command], retry_invalid, retry_rushed)[0]
+
+    def exchange(self, commands: list, retry_invalid: bool = False, retry_rushed: bool = False) -> list:
+        """
+        Writes several commands back to back and then reads one response per
+        command, so the whole batch costs a single round trip
+
+        Args:
+            commands: command lines without termination
+            retry_invalid: retry while the instrument answers INVALID, e.g. for
+                reads
+            retry_rushed: retry once if the instrument answers INVALID, e.g. for
+                sets: a set the instrument rejected was not applied, and the
+                retry tells whether it was sent too soon or is wrong
+        Returns:
+            unmodified bytes sent back by the instrument, in command order; the
+            INVALID responses of the last try once the tries are used up
+        """
+        policy = self.policy
+        if self.closed:
+            raise LinkDown("session to %s was closed" % self.resource)
+        if self.link_down:
+            self.rejected += 1
+            raise LinkDown("no answer from %s, retrying in %.0f s" %
+                           (self.resource, self.opened + policy.cooldown - policy.clock()))
+        # after the cooldown a single try decides whether the link is back
+        attempts = 1 if self.opened is not None else policy.attempts
+        pacer = self.pacer
+        termination = self.READ_TERMINATION.encode("ascii")
+        failure = None
+        unsure = 0
+        for attempt in range(attempts):
+            if attempt:
+                self.retries += 1
+                policy.sleep(policy.delay(attempt - 1))
+            pacer.wait()
+            try:
+                if failure is not None and self.is_io_error(failure):
+                    self.reconnect()
+                self.clear()
+                for command in commands:
+                    self.instrument.write(command)
+                # each read returns at the termination character, i.e. one line
+                responses = [check_frame(self.instrument.read_raw(), termination) for command in commands]
+            except Exception as error:
+                pacer.done()
+                if self.is_timeout(error):
+                    self.timeouts += 1
+                    pacer.backoff(False)
+                elif isinstance(error, FramingError):
+                    # the rest of the line, if any, is discarded before the retry
+                    self.framing += 1
+                elif self.is_io_error(error):
+                    self.errors += 1
+                else:
+                    raise
+                failure = error
+                continue
+            pacer.done()
+            # any answer, even INVALID, shows the link is alive
+            self.transactions += 1
+            self.failures = 0
+            self.opened = None
+            invalid = 0
+            rushed = False
+            for command, response in zip(commands, responses):
+                if response.rstrip().endswith(b"INVALID"):
+                    invalid += 1
+                    # a command that was answered before is not wrong, it came too soon
+                    rushed = rushed or command in self._answered
+                elif len(self._answered) < self.ANSWERED:
+                    self._answered.add(command)
+            self.invalid += invalid
+            # only the first try is sent after no more than the gap, so only it tells
+            # whether the gap is wide enough
+            if not attempt:
+                if rushed or not invalid:
+                    pacer.answered(rushed, not invalid)
+                else:
+                    unsure = invalid
+            elif unsure:
+                # INVALIDs that cleared on the retry came too soon on the first try
+                pacer.answered(invalid < unsure, False)
+                unsure = 0
+            retry = retry_invalid or (retry_rushed and not attempt)
+            if not (invalid and retry) or attempt == attempts - 1:
+                return responses
+            failure = None
+        self.failures += 1
+        if self.failures >= policy.threshold:
+            self.trips += self.opened is None
+            self.opened = policy.clock()
+        raise failure
+
+
+class ParameterCache:
+    """
+    Read-through cache for settings that only change when they are written, such
+    as the PID terms, heater limits and loop set points. Entries expire after a
+    time to live chosen per parameter, the last field of the command.
+
+    Attributes:
+        ttl: time to live (s) of each cached parameter
+        hits: number of reads served from the cache
+        misses: number of reads that went to the device
+    """
+
+    TTL = {
+        "P": 60.0,
+        "I": 60.0,
+        "D": 60.0,
+        "VLIM": 3600.0,
+        "RES": 3600.0,
+        # the loop itself drives HSET and FSET while auto control is on
+        "HSET": 5.0,
+        "FSET": 5.0,
+        "TSET": 10.0,
+    }
+
+    def __init__(self, ttl=None, clock=time.monotonic):
+        self.ttl = dict(self.TTL)
+        self.ttl.update(ttl or {})
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def cacheable(self, command: str) -> bool:
+        """
+        Checks whether the parameter read by a command is cached
+
+        Args:
+            command: device ID, device command, and option (DEV:UID:command:option)
+        Returns:
+            True when the parameter has a time to live
+        """
+        return command.rsplit(":", 1)[-1] in self.ttl
+
+    def get(self, command: str) -> str:
+        """
+        Gets a cached value that has not expired yet
+
+        Args:
+            command: device ID, device command, and option (DEV:UID:command:option)
+        Returns:
+            cached value or None
+        """
+        entry = self._entries.get(command)
+        if entry and entry[0] > self.clock():
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def put(self, command: str, value: str) -> None:
+        """
+        Caches a value read from the device
+
+        Args:
+            command: device ID, device command, and option (DEV:UID:command:option)
+            value: data read
+        """
+        ttl = self.ttl.get(command.rsplit(":", 1)[-1])
+        if ttl:
+            self._entries[command] = (self.clock() + ttl, value)
+
+    def invalidate(self, device: str = None) -> None:
+        """
+        Drops cached values so that the next reads go to the device
+
+        Args:
+            device: drop only the commands starting with this device path or
+                command, drop everything if None
+        """
+        if device is None:
+            self._entries.clear()
+        else:
+            for command in [command for command in self._entries if command.startswith(device)]:
+                del self._entries[command]
+
+
 class TemperatureController:
     """
     A simple driver for one-to-one remote operation from device to computer over USB. 
@@ -20,10 +692,10 @@ class TemperatureController:
         instrument: Oxford MecuryiTC 
     """
 
-    TERMINATION = "\n\r"
+    TERMINATION = VisaSession.WRITE_TERMINATION
 
     _version = ("*IDN?", "")
-    _devices = ("SYS:CAT",)
+    _devices = "SYS:CAT"
     _signal = "%s:SIG:%s"
     _voltage = "%s:VLIM"
     _resistance = "%s:RES"
@@ -39,16 +711,20 @@ class TemperatureController:
     _sweep = "%s:LOOP:SWFL"
     _sweeplim = "%s:CAL:HOTL"
 
-    def __init__(self, resource):
-        try:
-            self.instrument = visa.ResourceManager().open_resource(resource)
-            # sleep to confirm connection to port
-            time.sleep(1)
-            self.ratio = 0.0
-            self.max_voltage = {}
-            self.prev_value = {}
-        except visa.errors.VisaIOError:
-            pass
+    def __init__(self, resource, resource_manager=None, policy: RetryPolicy = None, pacer: Pacer = None):
+        self.ratio = 0.0
+        self.cache = ParameterCache()
+        self.max_voltage = {}
+        self.prev_value = {}
+        # errors opening the port are left to the caller, e.g. to try another port
+        self.session = VisaSession(resource, resource_manager, policy, pacer)
+
+    @property
+    def instrument(self):
+        """
+        The pyvisa resource behind the current session
+        """
+        return self.session.instrument
 
     def __enter__(self):
         self.resource = self.instrument.open()
@@ -59,15 +735,29 @@ class TemperatureController:
             self.instrument.close()
 
     @property
-    def devices(self) -> str:
+    def devices(self) -> list:
         """
         iTC is multi-channel which may have several sensor devices. They are the 
         devices listed on the front panel of the iTC 
 
         Returns:
-            A list of existing hardware devices
+            A list of existing hardware devices, e.g. ["DEV:MB1.T1:TEMP"]
         """
-        return self.read(*self._devices)
+        try:
+            return parse_catalog(self.query("READ:%s" % self._devices))
+        except MalformedResponse:
+            self.session.malformed += 1
+            raise
+
+    @property
+    def identity(self) -> str:
+        """
+        Full *IDN? response of the connected device, identifies the instrument
+
+        Returns:
+            manufacturer, model, serial number and firmware version
+        """
+        return self.query(self._version[0]).decode("ascii", "replace").strip()
 
     @property
     def version(self) -> str:
@@ -86,8 +776,52 @@ class TemperatureController:
         Args:
             value: read or set value to device
         """
-        self.instrument.write("%s%s" % (value, self.TERMINATION))
+        self.instrument.write(value)
 
+    def query(self, value: str, retry_invalid: bool = False, retry_rushed: bool = False) -> bytes:
+        """
+        write a string operation to device and read back the raw response on the
+        persistent session
+
+        Args:
+            value: read or set value to device
+            retry_invalid: retry while the device answers INVALID
+            retry_rushed: retry once if the device answers INVALID
+        Returns:
+            unmodified bytes sent back by the device
+        """
+        return self.session.query(value, retry_invalid, retry_rushed)
+
+    def exchange(self, values: list) -> list:
+        """
+        write several string operations to device and read back all raw responses
+        in one round trip
+
+        Args:
+            values: read or set values to device
+        Returns:
+            unmodified bytes sent back by the device, in order
+        """
+        return self.session.exchange(values)
+
+    def read_reading(self, value: str, prefix: str = "READ:") -> Reading:
+        """
+        Reads a typed value from device or interface synchronously
+
+        Args:
+            value: device ID, device command, and option (DEV:UID:command:option)
+            prefix: read command prefix
+        Returns:
+            typed reading of the response
+        """
+        # READ responses echo the command path after STAT:, other prefixes
+        # such as *IDN? answer in their own format
+        echo = value.encode("ascii") if prefix == "READ:" else None
+        try:
+            return parse_response(self.query("%s%s" % (prefix, value), retry_invalid=True), echo)
+        except MalformedResponse:
+            self.session.malformed += 1
+            raise
 
     def read(self, value: str, prefix: str = "READ:") -> str:
         """
@@ -99,16 +833,7 @@ class TemperatureController:
         Returns:
             data read, return value of the libary call
         """
-        # write a read command to device
-        self.write("%s%s" % (prefix, value))
-        # read_raw - read the unmodified string sent from the instrument to the computer
-        # truncate read_raw to remove write termination characters \r\n
-        try:
-            self.raw_data = str(self.instrument.read_raw()).split(":")[-1][:-3]
-            if self.raw_data == "INVALID":
-                time.sleep(1)
-        except TypeError:
-            pass
+        self.raw_data = self.read_reading(value, prefix).text
         return self.raw_data
 
     def set(self, value: str, prefix: str = "SET:") -> str:
@@ -121,9 +846,45 @@ class TemperatureController:
         Returns:
             data read, return value of the libary call
         """
-        self.write("%s%s" % (prefix, value))
+        # the echo is checked up to the parameter, the device may reformat the value
+        echo = (prefix + value.rsplit(":", 1)[0]).encode("ascii")
+        try:
+            # a set sent too soon is rejected without being applied, so it is safe to send again
+            status = parse_response(self.query("%s%s" % (prefix, value), retry_rushed=True), echo).text
+        except MalformedResponse:
+            self.session.malformed += 1
+            raise
+        if status == "VALID":
+            # the cached setting is out of date once the write went through
+            self.cache.invalidate(value.rsplit(":", 1)[0])
+        return status
+
+    def cached_read(self, value: str) -> str:
+        """
+        Reads a slow-changing setting, from the cache while it has not expired
 
-        return str(self.instrument.read_raw()).split(":")[-1][:-3]
+        Args:
+            value: device ID, device command, and option (DEV:UID:command:option)
+        Returns:
+            data read
+        """
+        if not self.cache.cacheable(value):
+            return self.read(value)
+        data = self.cache.get(value)
+        if data is None:
+            data = self.read(value)
+            if data != "INVALID":
+                self.cache.put(value, data)
+        return data
+
+    def refresh(self, device: str = None) -> None:
+        """
+        Forces the next reads of cached settings to go to the device
+
+        Args:
+            device: device path whose settings are refreshed, all devices if None
+        """
+        self.cache.invalidate(device)
 
     def open(self) -> None:
         """
@@ -145,6 +906,20 @@ class TemperatureController:
         except serial.serialutil.SerialException:
             pass
 
+    def clear(self) -> None:
+        """
+        Discards stale input on the open session without closing it
+
+        """
+        self.session.clear()
+
+    def reconnect(self) -> None:
+        """
+        Reopens the session, e.g. after the cable was unplugged
+
+        """
+        self.session.reconnect()
+
     # getters
     def get_signal(self, device: str, signal: str) -> list:
         """
@@ -163,6 +938,71 @@ class TemperatureController:
         except:
             return [device, self.prev_value[device]]
 
+    def get_reading(self, device: str, signal: str) -> Reading:
+        """
+        Get one front panel signal as a typed reading
+
+        Args:
+            device: device ID
+            signal: read command
+        Returns:
+            typed reading, the previous one if the response could not be used
+            and INVALID if the instrument could not be reached
+        """
+        return self.get_many({device: [signal]})[device][signal]
+
+    def get_signals(self, device: str, signals: list) -> dict:
+        """
+        Get several front panel signals of one device with a single READ command,
+        e.g. READ:DEV:MB1.T1:TEMP:SIG:TEMP:SIG:VOLT
+
+        Args:
+            device: device ID
+            signals: read commands
+        Returns:
+            typed reading of each signal
+        """
+        return self.get_many({device: signals})[device]
+
+    def get_many(self, signals: dict) -> dict:
+        """
+        Get front panel signals of several devices in one round trip. One READ line
+        is built per device and all lines are sent before the responses are read.
+
+        Args:
+            signals: read commands for each device ID
+        Returns:
+            typed reading of each device and signal, the previous reading or an
+            INVALID one for signals missing from a response, INVALID for every
+            signal while the instrument cannot be reached
+        """
+        devices = list(signals)
+        commands = [
+            "READ:" + DEVICES[device] + "".join(":SIG:%s" % signal for signal in signals[device])
+            for device in devices
+        ]
+        try:
+            responses = self.exchange(commands)
+        except (visa.errors.Error, serial.serialutil.SerialException, ConnectionError, FramingError) as error:
+            if isinstance(error, FramingError):
+                self.session.malformed += 1
+            # nothing was read, the previous readings would pass for fresh ones
+            return {device: dict.fromkeys(signals[device], INVALID) for device in devices}
+
+        values = {}
+        for device, response in zip(devices, responses):
+            try:
+                values[device] = parse_signals(response, DEVICES[device].encode("ascii"), signals[device])
+            except MalformedResponse:
+                self.session.malformed += 1
+                values[device] = dict.fromkeys(signals[device])
+            for signal, value in values[device].items():
+                if value is None:
+                    values[device][signal] = self.prev_value.get((device, signal), INVALID)
+                else:
+                    self.prev_value[(device, signal)] = value
+        return values
+
     def get_max_voltage(self, device=None) -> dict:
         """
         Reads the max voltage data from device 
@@ -175,19 +1015,13 @@ class TemperatureController:
         if not device:
             return self.max_voltage
 
-        #TODO: clean up max voltage update for heater and sensor
-        for i in range(5):
-            try:
-                self.max_voltage[device] = self.read(self._voltage % (DEVICES[device],))
-                if self.max_voltage[device] == "INVALID":
-                    time.sleep(1)
-                    self.close()
-                    self.open()
-                    raise exception
-                else:
-                    break
-            except:
-                pass
+        # the session retries, a failed read keeps the last limit read
+        try:
+            value = self.cached_read(self._voltage % (DEVICES[device],))
+        except (visa.errors.Error, serial.serialutil.SerialException, ConnectionError, MalformedResponse):
+            value = "INVALID"
+        if value != "INVALID" or device not in self.max_voltage:
+            self.max_voltage[device] = value
         return self.max_voltage
 
     def get_resistance(self, device: str) -> list:
@@ -199,7 +1033,7 @@ class TemperatureController:
         Returns:
             device and resistance data read 
         """
-        self.resistance = self.read(self._resistance % (DEVICES[device],))
+        self.resistance = self.cached_read(self._resistance % (DEVICES[device],))
         return [device, self.resistance]
 
     def get_heat_power_ratio(self, device: str) -> list:
@@ -212,12 +1046,11 @@ class TemperatureController:
             device and calculated power ratio 
         """
 
+        voltage = self.get_reading(device, "VOLT").value
         try:
-            voltage = float(self.get_signal(device, "VOLT")[1][:-1])
             self.ratio = 100.0 * (voltage / float(self.max_voltage[device])) ** 2
         except:
             pass
-        # Resource is closed then opened since there is a delay to query/write consecutive values
         return [device, self.ratio]
 
     def get_heater(self, device: str) -> list:
@@ -229,7 +1062,7 @@ class TemperatureController:
         Returns:
             device and heater percentage read 
         """
-        return ["Heat", self.read(self._heater % (device,))]
+        return ["Heat", self.cached_read(self._heater % (device,))]
 
     def get_flow(self, device: str) -> list:
         """
@@ -240,7 +1073,7 @@ class TemperatureController:
         Returns:
             device and flow percentage read 
         """
-        return ["Flow", self.read(self._flow % (device,))]
+        return ["Flow", self.cached_read(self._flow % (device,))]
 
     def get_setpoint(self, device: str) -> list:
         """
@@ -251,7 +1084,7 @@ class TemperatureController:
         Returns:
             device and set point read 
         """
-        return ["Set Point", self.read(self._setpoint % (device,))]
+        return ["Set Point", self.cached_read(self._setpoint % (device,))]
 
     def get_p(self, device: str) -> list:
         """
@@ -262,7 +1095,7 @@ class TemperatureController:
         Returns:
             device and P read 
         """
-        p = self.read(self._p % (device,))
+        p = self.cached_read(self._p % (device,))
         return ["P", p]
 
     def get_i(self, device: str) -> list:
@@ -274,7 +1107,7 @@ class TemperatureController:
         Returns:
             device and I read 
         """
-        i = self.read(self._i % (device,))
+        i = self.cached_read(self._i % (device,))
         return ["I", i]
 
     def get_d(self, device: str) -> list:
@@ -286,7 +1119,7 @@ class TemperatureController:
         Returns:
             device and D read 
         """
-        d = self.read(self._d % (device,))
+        d = self.cached_read(self._d % (device,))
         return ["D", d]
 
     def get_sweep_table(self, device: str) -> list:
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+from mercuryITC import VisaSession
+import json
+import os
+import pyvisa as visa
+
+
+# part of the *IDN? response identifying a Mercury iTC
+MODEL = "MERCURY ITC"
+
+# port and identity of the last instrument connected to
+STATE_PATH = os.path.join(os.path.expanduser("~"), ".mercuryitc", "ports.json")
+
+
+def identify(resource: str, resource_manager, timeout: float = 0.5) -> str:
+    """
+    Asks one port for its identity
+
+    Args:
+        resource: VISA resource name, e.g. ASRL3::INSTR
+        resource_manager: pyvisa resource manager
+        timeout: time to open the port and to wait for the answer (s)
+    Returns:
+        *IDN? response, None if the port does not answer or cannot be opened
+    """
+    instrument = None
+    try:
+        instrument = resource_manager.open_resource(resource, open_timeout=int(1000 * timeout))
+        instrument.timeout = int(1000 * timeout)
+        # a line based device answers as soon as its line is complete
+        instrument.write_termination = VisaSession.WRITE_TERMINATION
+        instrument.read_termination = VisaSession.READ_TERMINATION
+        instrument.write("*IDN?")
+        return instrument.read_raw().decode("ascii", "replace").strip() or None
+    except Exception:
+        # busy, absent or silent ports are just not instruments
+        return None
+    finally:
+        if instrument is not None:
+            try:
+                instrument.close()
+            except Exception:
+                pass
+
+
+def probe(resources=None, resource_manager=None, timeout: float = 0.5, workers: int = 32) -> dict:
+    """
+    Asks every port for its identity at the same time, so finding the instrument
+    takes about one timeout however many ports there are
+
+    Args:
+        resources: VISA resource names, every listed resource if None
+        resource_manager: pyvisa resource manager, a new one if None
+        timeout: time to open each port and to wait for its answer (s)
+        workers: number of ports probed in parallel
+    Returns:
+        *IDN? response of every port with a Mercury iTC, keyed by resource
+    """
+    resource_manager = resource_manager or visa.ResourceManager()
+    if resources is None:
+        resources = resource_manager.list_resources()
+    resources = list(resources)
+    if not resources:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(resources))) as pool:
+        identities = pool.map(lambda resource: identify(resource, resource_manager, timeout), resources)
+        return {resource: identity for resource, identity in zip(resources, identities)
+                if identity and MODEL in identity.upper()}
+
+
+def remember(resource: str, identity: str, path: str = STATE_PATH) -> None:
+    """
+    Stores the instrument connected to, for reconnecting on the next start
+
+    Args:
+        resource: VISA resource name
+        identity: *IDN? response of the instrument
+        path: state file
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "w") as state:
+        json.dump({"resource": resource, "identity": identity}, state)
+    os.replace(path + ".tmp", path)
+
+
+def remembered(path: str = STATE_PATH) -> dict:
+    """
+    Instrument connected to last
+
+    Args:
+        path: state file
+    Returns:
+        resource and identity, empty if nothing was stored
+    """
+    try:
+        with open(path) as state:
+            return json.load(state)
+    except (OSError, ValueError):
+        return {}
+
+
+def reconnect_target(found: dict, path: str = STATE_PATH) -> str:
+    """
+    Port to reconnect to, where the remembered instrument was found again. The
+    identity is matched rather than the port, so renumbered ports still match.
+
+    Args:
+        found: *IDN? response of every port with a Mercury iTC
+        path: state file
+    Returns:
+        VISA resource name, None if the remembered instrument was not found
+    """
+    last = remembered(path)
+    if not last:
+        return None
+    if found.get(last.get("resource")) == last.get("identity"):
+        return last["resource"]
+    for resource, identity in found.items():
+        if identity == last.get("identity"):
+            return resource
+    return None
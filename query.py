@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from datalogger import BLOCK, OK, DataLog
+from datetime import datetime
+from typing import NamedTuple
+import numpy as np
+
+
+class Aggregate(NamedTuple):
+    """
+    Statistics of one channel in fixed width time buckets
+
+    Attributes:
+        times: start time of each bucket (s)
+        lows: minimum of each bucket, NaN if empty
+        highs: maximum of each bucket, NaN if empty
+        means: mean of each bucket, NaN if empty
+        counts: number of valid readings in each bucket
+    """
+    times: np.ndarray
+    lows: np.ndarray
+    highs: np.ndarray
+    means: np.ndarray
+    counts: np.ndarray
+
+
+def seconds(when) -> float:
+    """
+    Wall clock time of a query bound
+
+    Args:
+        when: datetime, or seconds since the epoch
+    Returns:
+        seconds since the epoch, None stays None
+    """
+    if isinstance(when, datetime):
+        return when.timestamp()
+    return when
+
+
+class Query:
+    """
+    Read-only queries of a data log, e.g. the DB6 temperature between 02:00 and
+    04:00 of a night. Time ranges are found through the sparse index of each
+    segment, raw or archived, and aggregates use the per block statistics of the index for every
+    block that falls into a single bucket, so only the records of blocks that
+    straddle a bucket edge are read. A month at 1 Hz reduces to a plot in
+    milliseconds.
+
+    Attributes:
+        log: data log queried
+    """
+
+    def __init__(self, log):
+        self.log = log if isinstance(log, DataLog) else DataLog(log)
+
+    def range(self, channel: str, start=None, end=None) -> tuple:
+        """
+        Readings of one channel in a time span
+
+        Args:
+            channel: channel name, e.g. DB6:TEMP
+            start: earliest time, datetime or seconds since the epoch, from the first record if None
+            end: time after the span, up to the last record if None
+        Returns:
+            times (s) and values, NaN where the reading was invalid
+        """
+        self.log.refresh()
+        number = self.log.channels.get(channel)
+        times = []
+        values = []
+        if number is not None:
+            for name, records, first, last in self.log.slices(seconds(start), seconds(end)):
+                records = records[first:last]
+                records = records[records["channel"] == number]
+                times.append(records["time"])
+                values.append(records["value"])
+        if not times:
+            return np.empty(0), np.empty(0)
+        return np.concatenate(times), np.concatenate(values)
+
+    def aggregate(self, channel: str, start, end, buckets: int) -> Aggregate:
+        """
+        Minimum, maximum and mean of one channel in fixed width time buckets
+
+        Args:
+            channel: channel name, e.g. DB6:TEMP
+            start: start of the first bucket, datetime or seconds since the epoch
+            end: end of the last bucket
+            buckets: number of buckets, e.g. one per pixel column of a plot
+        Returns:
+            statistics of each bucket
+        """
+        start = seconds(start)
+        width = (seconds(end) - start) / buckets
+        self.log.refresh()
+        number = self.log.channels.get(channel)
+        # means holds the sums until every segment is added up
+        totals = Aggregate(start + width * np.arange(buckets), np.full(buckets, np.nan), np.full(buckets, np.nan),
+                           np.zeros(buckets), np.zeros(buckets, np.int64))
+        if number is not None:
+            for name, records, first, last in self.log.slices(start, start + width * buckets):
+                self._segment(totals, number, name, records, first, last, start, width)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(totals.counts > 0, totals.means / totals.counts, np.nan)
+        return totals._replace(means=means)
+
+    def _segment(self, totals: Aggregate, number: int, name: str, records: np.ndarray, first: int, last: int,
+                 start: float, width: float) -> None:
+        summary = self.log.summary(name)
+        # blocks lying completely inside the record range
+        low = -(-first // BLOCK)
+        high = last // BLOCK
+        if summary is None or low >= high:
+            self._records(totals, number, records[first:last], start, width)
+            return
+        self._records(totals, number, records[first:low * BLOCK], start, width)
+        self._records(totals, number, records[high * BLOCK:last], start, width)
+
+        # a block within one bucket is taken from the index, the others record by record
+        opening = np.floor((summary["first"][low:high] - start) / width).astype(np.int64)
+        closing = np.floor((summary["last"][low:high] - start) / width).astype(np.int64)
+        clean = opening == closing
+        dirty = np.flatnonzero(~clean) + low
+        if len(dirty):
+            # neighbouring straddling blocks are read as one range
+            breaks = np.flatnonzero(np.diff(dirty) > 1)
+            for opened, closed in zip(dirty[np.r_[0, breaks + 1]], dirty[np.r_[breaks, len(dirty) - 1]]):
+                self._records(totals, number, records[opened * BLOCK:(closed + 1) * BLOCK], start, width)
+
+        blocks = summary["block"]
+        entries = slice(int(np.searchsorted(blocks, low, "left")), int(np.searchsorted(blocks, high, "left")))
+        block = blocks[entries] - low
+        selected = (summary["channel"][entries] == number) & clean[block]
+        _accumulate(totals, opening[block[selected]], summary["min"][entries][selected],
+                    summary["max"][entries][selected], summary["sum"][entries][selected],
+                    summary["count"][entries][selected])
+
+    def _records(self, totals: Aggregate, number: int, records: np.ndarray, start: float, width: float) -> None:
+        if not len(records):
+            return
+        records = records[(records["channel"] == number) & (records["status"] == OK)]
+        values = np.asarray(records["value"])
+        index = np.floor((records["time"] - start) / width).astype(np.int64)
+        _accumulate(totals, index, values, values, values, np.ones(len(values), np.int64))
+
+
+def _accumulate(totals: Aggregate, index: np.ndarray, lows: np.ndarray, highs: np.ndarray, sums: np.ndarray,
+                counts: np.ndarray) -> None:
+    # index is sorted, so each bucket is one run reduced in a single pass
+    inside = (index >= 0) & (index < len(totals.times))
+    index = index[inside]
+    if not len(index):
+        return
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    at = index[starts]
+    totals.lows[at] = np.fmin(totals.lows[at], np.minimum.reduceat(lows[inside], starts))
+    totals.highs[at] = np.fmax(totals.highs[at], np.maximum.reduceat(highs[inside], starts))
+    totals.means[at] += np.add.reduceat(sums[inside], starts)
+    totals.counts[at] += np.add.reduceat(counts[inside], starts)
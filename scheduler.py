@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+import heapq
+import itertools
+import math
+import threading
+import time
+
+
+class PollScheduler:
+    """
+    Deadline based polling scheduler. Each channel has a period and a priority
+    and sits in a heap of (deadline, priority, channel) entries. Deadlines are
+    advanced by whole periods on a monotonic clock, so sample times do not drift
+    with the time spent reading, and channels that fall due together are handed
+    out together so they can share one round trip.
+
+    Attributes:
+        window: channels due within this time (s) of the first one are batched
+        clock: monotonic time source
+    """
+
+    def __init__(self, window: float = 0.05, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._heap = []
+        self._channels = {}
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+
+    def add(self, channel: str, period: float, priority: int = 0, start: float = None) -> None:
+        """
+        Schedules a channel, or changes the period and priority of a scheduled one
+
+        Args:
+            channel: channel name, e.g. device ID
+            period: time between samples (s)
+            priority: lower values are read first when channels are due together
+            start: first deadline on the scheduler clock, now if None
+        """
+        with self._condition:
+            state = self._channels.get(channel)
+            if state and state["period"] == period and state["priority"] == priority:
+                return
+            if state is None:
+                state = {"samples": 0, "missed": 0, "mean": 0.0, "m2": 0.0, "max": 0.0,
+                         "boost_period": None, "boost_until": 0.0, "generation": 0}
+                self._channels[channel] = state
+            state["period"] = period
+            state["priority"] = priority
+            self._push(channel, self.clock() if start is None else start)
+            # the new deadline may be earlier than the one a waiter sleeps until
+            self._condition.notify_all()
+
+    def set_period(self, channel: str, period: float) -> None:
+        """
+        Changes the period of a scheduled channel, keeping its priority and any
+        unexpired boost. The next sample is due one new period from now at the latest.
+
+        Args:
+            channel: channel name
+            period: time between samples (s)
+        """
+        with self._condition:
+            state = self._channels.get(channel)
+            if state is None or state["period"] == period:
+                return
+            state["period"] = period
+            deadline = self.clock() + period
+            if deadline < state["deadline"]:
+                self._push(channel, deadline)
+                self._condition.notify_all()
+
+    def remove(self, channel: str) -> None:
+        """
+        Stops polling a channel
+
+        Args:
+            channel: channel name
+        """
+        with self._condition:
+            self._channels.pop(channel, None)
+
+    def boost(self, channel: str, period: float, duration: float) -> None:
+        """
+        Temporarily polls a channel faster, e.g. the gas flow after a flow write.
+        The channel is read right away and falls back to its own period once the
+        boost expires.
+
+        Args:
+            channel: channel name
+            period: boosted time between samples (s)
+            duration: time the boost lasts (s)
+        """
+        with self._condition:
+            state = self._channels.get(channel)
+            if state is None:
+                return
+            now = self.clock()
+            state["boost_period"] = period
+            state["boost_until"] = now + duration
+            self._push(channel, now)
+            self._condition.notify_all()
+
+    def period(self, channel: str) -> float:
+        """
+        Current period of a channel, including an unexpired boost
+
+        Args:
+            channel: channel name
+        Returns:
+            time between samples (s)
+        """
+        state = self._channels[channel]
+        if state["boost_period"] is not None and self.clock() < state["boost_until"]:
+            return state["boost_period"]
+        return state["period"]
+
+    def _push(self, channel: str, deadline: float) -> None:
+        # a new generation makes older heap entries of the channel stale
+        state = self._channels[channel]
+        state["generation"] += 1
+        state["deadline"] = deadline
+        heapq.heappush(self._heap, (deadline, state["priority"], next(self._order), channel, state["generation"]))
+
+    def _prune(self) -> None:
+        while self._heap:
+            deadline, priority, order, channel, generation = self._heap[0]
+            state = self._channels.get(channel)
+            if state and state["generation"] == generation:
+                return
+            heapq.heappop(self._heap)
+
+    def next_deadline(self) -> float:
+        """
+        Earliest deadline of all channels
+
+        Returns:
+            deadline on the scheduler clock, None when nothing is scheduled
+        """
+        with self._condition:
+            self._prune()
+            return self._heap[0][0] if self._heap else None
+
+    def due(self, now: float = None) -> list:
+        """
+        Takes every channel that is due and schedules its next deadline
+
+        Args:
+            now: time on the scheduler clock, current time if None
+        Returns:
+            due channels, highest priority first
+        """
+        with self._condition:
+            now = self.clock() if now is None else now
+            due = []
+            self._prune()
+            while self._heap and self._heap[0][0] <= now + self.window:
+                deadline, priority, order, channel, generation = heapq.heappop(self._heap)
+                state = self._channels.get(channel)
+                if not state or state["generation"] != generation:
+                    continue
+                self._record(state, max(now - deadline, 0.0))
+                period = self.period(channel)
+                following = deadline + period
+                if following <= now:
+                    # fell behind by whole periods: skip them instead of bursting
+                    skipped = math.floor((now - deadline) / period)
+                    state["missed"] += skipped
+                    following = deadline + (skipped + 1) * period
+                self._push(channel, following)
+                due.append((priority, order, channel))
+                self._prune()
+            return [channel for priority, order, channel in sorted(due)]
+
+    def wait(self, running=None) -> list:
+        """
+        Sleeps until the next deadline and takes the channels that are due
+
+        Args:
+            running: callable returning False to stop waiting early
+        Returns:
+            due channels, highest priority first, empty if the wait was stopped
+        """
+        with self._condition:
+            while running is None or running():
+                deadline = self.next_deadline()
+                now = self.clock()
+                if deadline is not None and deadline <= now + self.window:
+                    return self.due(now)
+                self._condition.wait(None if deadline is None else deadline - now)
+        return []
+
+    def wake(self) -> None:
+        """
+        Wakes a thread blocked in wait(), e.g. to let it see that it should stop
+
+        """
+        with self._condition:
+            self._condition.notify_all()
+
+    def _record(self, state: dict, lateness: float) -> None:
+        # Welford running mean and variance of the lateness
+        state["samples"] += 1
+        delta = lateness - state["mean"]
+        state["mean"] += delta / state["samples"]
+        state["m2"] += delta * (lateness - state["mean"])
+        state["max"] = max(state["max"], lateness)
+
+    def stats(self) -> dict:
+        """
+        Timing statistics of every channel
+
+        Returns:
+            samples taken, deadlines missed, period and lateness (s) per channel
+        """
+        with self._condition:
+            stats = {}
+            for channel, state in self._channels.items():
+                samples = state["samples"]
+                stats[channel] = {
+                    "period": self.period(channel),
+                    "samples": samples,
+                    "missed": state["missed"],
+                    "mean_lateness": state["mean"],
+                    "max_lateness": state["max"],
+                    "jitter": math.sqrt(state["m2"] / (samples - 1)) if samples > 1 else 0.0,
+                }
+            return stats
@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from collections import deque
+from constants import DEVICES, SENSORS, TEMP_HEATERS
+import argparse
+import math
+import pyvisa as visa
+import random
+import socketserver
+import threading
+import time
+
+
+class MercuryModel:
+    """
+    Thermal model and SCPI parser for a simulated Mercury iTC. Speaks the
+    subset of the command set used by TemperatureController: *IDN?, SYS:CAT,
+    READ of SIG, NICK, VLIM, RES and LOOP:P/I/D/HSET/FSET/TSET/ENAB/SWMD/FAUT/
+    SWFL/HTR/AUX, and SET of the settings.
+
+    Each temperature sensor is a single heat capacity linked to the helium bath,
+    warmed by its loop heater and cooled by the gas flow of its loop. The model
+    is advanced lazily to the current time whenever a command is handled.
+
+    Attributes:
+        devices: device ID and device path of each module, see constants.DEVICES
+        temperature: simulated temperature (K) of each TEMP device
+        loops: heater and flow device IDs of each TEMP device
+        nicks: front panel nickname of each device
+    """
+
+    IDN = "IDN:OXFORD INSTRUMENTS:MERCURY ITC:SIM0001:2.6.04.000"
+
+    BATH = 1.5          # helium bath temperature (K)
+    ROOM = 300.0        # room temperature (K)
+    CAPACITY = 5.0      # heat capacity of a sensor stage (J/K)
+    LINK = 0.05         # thermal link from sensor stage to bath (W/K)
+    LEAK = 0.001        # heat leak from room to sensor stage (W/K)
+    FLOW = 0.5          # extra cooling at 100% gas flow (W/K)
+    STEP = 0.5          # longest integration step (s)
+    HORIZON = 1000.0    # longest stretch of time integrated in one go (s)
+
+    SETTINGS = {
+        "VLIM": (0.0, 40.0),
+        "RES": (10.0, 2000.0),
+        "P": (0.0, 1000.0),
+        "I": (0.0, 1000.0),
+        "D": (0.0, 1000.0),
+        "HSET": (0.0, 100.0),
+        "FSET": (0.0, 100.0),
+        "TSET": (0.0, 2000.0),
+        "ENAB": ("ON", "OFF"),
+        "SWMD": ("ON", "OFF"),
+        "FAUT": ("ON", "OFF"),
+    }
+
+    def __init__(self, devices=None, temperature=10.0, clock=time.monotonic):
+        self.devices = dict(devices or DEVICES)
+        self.clock = clock
+        self.time = clock()
+        self.paths = {path: device for device, path in self.devices.items()}
+        self.kind = {device: path.split(":")[-1] for device, path in self.devices.items()}
+        self.uids = {device: path.split(":")[1] for device, path in self.devices.items()}
+        # nicknames as in constants.SENSORS, e.g. VTI_Hx for VTI_Hx_MB1.T
+        self.nicks = {}
+        for device in self.devices:
+            name = SENSORS.get(device, [""])[0]
+            self.nicks[device] = name.rsplit("_", 1)[0] if "_" in name else self.uids[device]
+
+        heaters = {pair[1]: pair[0] for pair in TEMP_HEATERS.values()}
+        flows = [device for device, kind in self.kind.items() if kind == "AUX"]
+        self.temperature = {}
+        self.loops = {}
+        self.params = {}
+        for device, kind in self.kind.items():
+            if kind == "TEMP":
+                self.temperature[device] = temperature
+                heater = heaters.get(self.devices[device])
+                flow = flows.pop(0) if flows else None
+                self.loops[device] = (heater, flow)
+                self.params[device] = {
+                    "P": 5.0, "I": 1.0, "D": 0.0, "HSET": 0.0, "FSET": 0.0,
+                    "TSET": temperature, "ENAB": "OFF", "SWMD": "OFF",
+                    "FAUT": "OFF", "SWFL": "None", "integral": 0.0,
+                }
+            elif kind == "HTR":
+                self.params[device] = {"VLIM": 40.0, "RES": 20.0}
+
+    def heater_voltage(self, heater: str, loop: str) -> float:
+        """
+        Output voltage of a heater for the heater percentage of its loop
+
+        Args:
+            heater: heater device ID
+            loop: TEMP device ID driving the heater
+        Returns:
+            heater voltage (V)
+        """
+        return self.params[heater]["VLIM"] * math.sqrt(self.params[loop]["HSET"] / 100.0)
+
+    def advance(self, now=None) -> None:
+        """
+        Integrates the thermal model up to the given time
+
+        Args:
+            now: time on the model clock, defaults to the current time
+        """
+        now = self.clock() if now is None else now
+        elapsed = min(now - self.time, self.HORIZON)
+        self.time = now
+        if elapsed <= 0:
+            return
+        steps = int(math.ceil(elapsed / self.STEP))
+        dt = elapsed / steps
+        for step in range(steps):
+            for device, (heater, flow) in self.loops.items():
+                loop = self.params[device]
+                temperature = self.temperature[device]
+                if loop["ENAB"] == "ON":
+                    error = loop["TSET"] - temperature
+                    if loop["I"] > 0:
+                        loop["integral"] += error * dt / (60.0 * loop["I"])
+                    loop["HSET"] = min(max(loop["P"] * (error + loop["integral"]), 0.0), 100.0)
+                if flow and loop["FAUT"] == "ON":
+                    loop["FSET"] = min(max(5.0 * (temperature - loop["TSET"]), 0.0), 100.0)
+                power = 0.0
+                if heater:
+                    power = self.heater_voltage(heater, device) ** 2 / self.params[heater]["RES"]
+                cooling = self.LINK + (self.FLOW * loop["FSET"] / 100.0 if flow else 0.0)
+                power += self.LEAK * (self.ROOM - temperature) - cooling * (temperature - self.BATH)
+                self.temperature[device] = min(max(temperature + power * dt / self.CAPACITY, self.BATH), 2000.0)
+
+    def loop_of(self, device: str, role: int) -> str:
+        """
+        TEMP device whose loop drives a heater (role 0) or gas flow (role 1)
+
+        Args:
+            device: HTR or AUX device ID
+            role: 0 for heaters, 1 for gas flow
+        Returns:
+            TEMP device ID or None when no loop uses the device
+        """
+        for loop, devices in self.loops.items():
+            if devices[role] == device:
+                return loop
+        return None
+
+    def signal(self, device: str, name: str) -> str:
+        """
+        Front panel reading of one device with its unit
+
+        Args:
+            device: device ID
+            name: signal name, e.g. TEMP, VOLT, PERC
+        Returns:
+            formatted reading or None when the device has no such signal
+        """
+        kind = self.kind[device]
+        if kind == "TEMP":
+            temperature = self.temperature[device]
+            voltage = 1.0 / (1.0 + temperature / 50.0)
+            values = {
+                "TEMP": "%.4fK" % temperature,
+                "VOLT": "%.6fV" % voltage,
+                "CURR": "%.6fA" % 1e-5,
+                "RES": "%.4fO" % (voltage / 1e-5),
+                "POWR": "%.6fW" % (voltage * 1e-5),
+            }
+        elif kind == "HTR":
+            loop = self.loop_of(device, 0)
+            voltage = self.heater_voltage(device, loop) if loop else 0.0
+            current = voltage / self.params[device]["RES"]
+            values = {
+                "VOLT": "%.4fV" % voltage,
+                "CURR": "%.4fA" % current,
+                "POWR": "%.4fW" % (voltage * current),
+            }
+        else:
+            loop = self.loop_of(device, 1)
+            values = {"PERC": "%.4f%%" % (self.params[loop]["FSET"] if loop else 0.0)}
+        return values.get(name)
+
+    def setting(self, device: str, name: str) -> str:
+        value = self.params.get(device, {}).get(name)
+        if value is None or name == "integral":
+            return None
+        if isinstance(value, float):
+            return "%.4f" % value
+        return value
+
+    def handle(self, command: str) -> str:
+        """
+        Executes one command line
+
+        Args:
+            command: command without termination
+        Returns:
+            response line without termination
+        """
+        self.advance()
+        if command == "*IDN?":
+            return self.IDN
+        if command == "READ:SYS:CAT":
+            return "STAT:SYS:CAT:" + ":".join(self.devices[device] for device in self.devices)
+
+        tokens = command.split(":")
+        operation = tokens[0]
+        # READ responses echo the command without READ:, SET responses echo it all
+        echo = ":".join(tokens[1:]) if operation == "READ" else command
+        path = ":".join(tokens[1:4])
+        device = self.paths.get(path)
+        if operation not in ("READ", "SET") or device is None or len(tokens) < 5:
+            return "STAT:%s:INVALID" % echo
+        params = tokens[4:]
+        if params[0] == "LOOP":
+            params = params[1:]
+
+        if operation == "READ":
+            if params[0] == "SIG":
+                response = []
+                for name in params[1::2]:
+                    response.append("SIG:%s:%s" % (name, self.signal(device, name) or "INVALID"))
+                return "STAT:%s:%s" % (path, ":".join(response))
+            value = self.setting(device, params[0]) if len(params) == 1 else None
+            if params == ["NICK"]:
+                value = self.nicks[device]
+            elif len(params) == 1 and params[0] in ("HTR", "AUX") and device in self.loops:
+                # UID of the heater or gas flow device the loop drives
+                other = self.loops[device][params[0] == "AUX"]
+                value = self.uids[other] if other else "None"
+            return "STAT:%s:%s" % (echo, value or "INVALID")
+
+        status = "INVALID"
+        if len(params) == 2 and params[0] in self.params.get(device, {}) and params[0] != "integral":
+            name, value = params
+            limits = self.SETTINGS.get(name)
+            if limits and isinstance(limits[0], str):
+                if value in limits:
+                    self.params[device][name] = value
+                    status = "VALID"
+            elif limits:
+                try:
+                    number = float(value)
+                    if limits[0] <= number <= limits[1]:
+                        self.params[device][name] = number
+                        status = "VALID"
+                except ValueError:
+                    pass
+            else:
+                self.params[device][name] = value
+                status = "VALID"
+            if status == "VALID" and name in ("ENAB", "TSET"):
+                self.params[device]["integral"] = 0.0
+        return "STAT:%s:%s" % (echo, status)
+
+
+class SimulatedInstrument:
+    """
+    Stand-in for a pyvisa message based resource backed by a MercuryModel.
+    Commands are processed in order, each taking its configured latency plus
+    random jitter, and a fraction of the responses can be replaced by INVALID.
+    Like a busy instrument, it can also answer INVALID to commands that arrive
+    sooner than a minimum gap after the previous answer.
+
+    Attributes:
+        model: simulated Mercury iTC
+        latency: default time to answer one command (s)
+        latencies: latency of commands containing a given keyword, e.g. {"SIG": 0.05}
+        jitter: maximum random extra latency (s)
+        invalid_rate: probability that a response is replaced by INVALID
+        min_gap: commands written sooner than this (s) after the last answer
+            are answered INVALID, batched commands are not affected
+        timeout: read timeout (ms), as for pyvisa resources
+    """
+
+    resource_name = "SIM::INSTR"
+
+    def __init__(self, model=None, latency=0.0, jitter=0.0, invalid_rate=0.0,
+                 latencies=None, seed=None, min_gap=0.0):
+        self.model = model or MercuryModel()
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.jitter = jitter
+        self.invalid_rate = invalid_rate
+        self.min_gap = min_gap
+        self.random = random.Random(seed)
+        self.timeout = 2000
+        self.read_termination = None
+        self.write_termination = "\r\n"
+        self.session = None
+        self._lock = threading.Lock()
+        self._responses = deque()
+        self._busy_until = 0.0
+        self.open()
+
+    def delay(self, command: str) -> float:
+        """
+        Time the simulated instrument takes to answer a command
+
+        Args:
+            command: command without termination
+        Returns:
+            latency including jitter (s)
+        """
+        latency = self.latency
+        for keyword, value in self.latencies.items():
+            if keyword in command:
+                latency = value
+                break
+        return latency + self.random.uniform(0.0, self.jitter)
+
+    def respond(self, command: str) -> str:
+        """
+        Executes one command and applies INVALID injection
+
+        Args:
+            command: command without termination
+        Returns:
+            response line without termination
+        """
+        with self._lock:
+            response = self.model.handle(command)
+        if self.invalid_rate and self.random.random() < self.invalid_rate:
+            response = response.rsplit(":", 1)[0] + ":INVALID"
+        return response
+
+    def open(self) -> None:
+        self.session = 1
+        self._responses.clear()
+
+    def close(self) -> None:
+        self.session = None
+
+    def _check(self) -> None:
+        if self.session is None:
+            raise visa.errors.InvalidSession()
+
+    def write_raw(self, message: bytes) -> int:
+        self._check()
+        now = time.monotonic()
+        for line in message.decode("ascii").replace("\r", "\n").split("\n"):
+            if line:
+                # commands queued behind an unanswered one, i.e. a batch, are fine
+                rushed = self._busy_until <= now < self._busy_until + self.min_gap
+                self._busy_until = max(self._busy_until, now) + self.delay(line)
+                response = self.respond(line)
+                if rushed:
+                    response = response.rsplit(":", 1)[0] + ":INVALID"
+                self._responses.append((self._busy_until, response))
+        return len(message)
+
+    def write(self, message: str, termination=None, encoding=None) -> int:
+        termination = self.write_termination if termination is None else termination
+        return self.write_raw((message + (termination or "")).encode("ascii"))
+
+    def read_raw(self, size=None) -> bytes:
+        self._check()
+        if not self._responses:
+            time.sleep(self.timeout / 1000.0)
+            raise visa.errors.VisaIOError(visa.constants.StatusCode.error_timeout)
+        ready, response = self._responses.popleft()
+        wait = ready - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        return (response + "\n").encode("ascii")
+
+    def read(self, termination=None, encoding=None) -> str:
+        return self.read_raw().decode("ascii").rstrip("\r\n")
+
+    def query(self, message: str, delay=None) -> str:
+        self.write(message)
+        return self.read()
+
+    def flush(self, mask) -> None:
+        self._check()
+        # only responses that the instrument has already sent can be discarded
+        now = time.monotonic()
+        while self._responses and self._responses[0][0] <= now:
+            self._responses.popleft()
+
+    def clear(self) -> None:
+        self._responses.clear()
+
+
+class SimulatedResourceManager:
+    """
+    Stand-in for pyvisa.ResourceManager that hands out one simulated instrument,
+    so TemperatureController(resource, SimulatedResourceManager()) runs without
+    hardware
+
+    Attributes:
+        instrument: simulated instrument returned by open_resource
+    """
+
+    def __init__(self, instrument=None, **options):
+        self.instrument = instrument or SimulatedInstrument(**options)
+
+    def list_resources(self, query="?*::INSTR") -> tuple:
+        return (self.instrument.resource_name,)
+
+    def open_resource(self, resource_name, **kwargs) -> SimulatedInstrument:
+        self.instrument.open()
+        return self.instrument
+
+
+class _LineHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        instrument = self.server.instrument
+        busy_until = 0.0
+        for line in self.rfile:
+            for command in line.decode("ascii", "replace").replace("\r", "\n").split("\n"):
+                if not command:
+                    continue
+                busy_until = max(busy_until, time.monotonic()) + instrument.delay(command)
+                response = instrument.respond(command)
+                wait = busy_until - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.wfile.write((response + "\n").encode("ascii"))
+
+
+def serve(instrument=None, host="127.0.0.1", port=7020) -> socketserver.ThreadingTCPServer:
+    """
+    Serves a simulated instrument over a loopback TCP socket, so pyvisa can open
+    it as TCPIP::127.0.0.1::<port>::SOCKET
+
+    Args:
+        instrument: simulated instrument, a default one is created if None
+        host: interface to listen on
+        port: TCP port to listen on, 0 picks a free port
+    Returns:
+        running server, stop it with shutdown()
+    """
+    server = socketserver.ThreadingTCPServer((host, port), _LineHandler)
+    server.daemon_threads = True
+    server.instrument = instrument or SimulatedInstrument()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated Mercury iTC on a loopback TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7020)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per command")
+    parser.add_argument("--jitter", type=float, default=0.005, help="maximum extra seconds per command")
+    parser.add_argument("--invalid-rate", type=float, default=0.0, help="fraction of INVALID responses")
+    parser.add_argument("--min-gap", type=float, default=0.0,
+                        help="seconds after an answer during which commands are answered INVALID")
+    args = parser.parse_args()
+
+    server = serve(SimulatedInstrument(latency=args.latency, jitter=args.jitter,
+                                       invalid_rate=args.invalid_rate, min_gap=args.min_gap),
+                   args.host, args.port)
+    print("Simulated Mercury iTC on TCPIP::%s::%d::SOCKET" % server.server_address)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
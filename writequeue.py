@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+"""
+
+
+from concurrent.futures import Future
+from typing import NamedTuple
+import threading
+
+
+# getter confirming each coalesced setter
+READBACK = {
+    "set_heater": "get_heater",
+    "set_flow": "get_flow",
+    "set_setpoint": "get_setpoint",
+    "set_p": "get_p",
+    "set_i": "get_i",
+    "set_d": "get_d",
+}
+
+
+class WriteResult(NamedTuple):
+    """
+    Outcome of a queued write
+
+    Attributes:
+        status: VALID or INVALID as answered by the instrument
+        readback: getter result confirming the value, None if the write was
+            superseded while in flight, failed or has no getter
+    """
+    status: str
+    readback: list = None
+
+
+class WriteQueue:
+    """
+    Coalescing queue of setting writes. At most one write per (device, setter)
+    is on the wire; while it is, only the newest value is kept and every value
+    it replaces is cancelled, so a burst of edits costs two transactions
+    instead of one per edit. The last value written is confirmed with a single
+    read-back.
+
+    Writes are submitted to the instrument without waiting, completions run on
+    the thread serving the instrument.
+
+    Attributes:
+        tc: temperature controller, usually an ArbiterProxy at arbiter.WRITE
+    """
+
+    def __init__(self, tc):
+        self.tc = tc
+        self._pending = {}
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    def submit(self, method: str, value, device: str) -> Future:
+        """
+        Queues a write, replacing a queued write of the same setting
+
+        Args:
+            method: TemperatureController setter, e.g. set_setpoint
+            value: value to write
+            device: device ID
+        Returns:
+            future completed with a WriteResult, cancelled if superseded
+        """
+        key = (device, method)
+        future = Future()
+        with self._lock:
+            replaced = self._pending.get(key)
+            self._pending[key] = (value, future)
+            idle = key not in self._busy
+            self._busy.add(key)
+        if replaced:
+            replaced[1].cancel()
+        if idle:
+            self._next(key)
+        return future
+
+    def _next(self, key: tuple) -> None:
+        while True:
+            with self._lock:
+                if key not in self._pending:
+                    self._busy.discard(key)
+                    return
+                value, future = self._pending.pop(key)
+            # the caller may have cancelled it meanwhile
+            if future.set_running_or_notify_cancel():
+                break
+        device, method = key
+        self._call(method, value, device).add_done_callback(lambda done: self._written(key, future, done))
+
+    def _written(self, key: tuple, future: Future, done: Future) -> None:
+        try:
+            status = done.result()
+        except Exception as error:
+            future.set_exception(error)
+            self._next(key)
+            return
+        device, method = key
+        with self._lock:
+            superseded = key in self._pending
+        if superseded or status != "VALID" or method not in READBACK:
+            future.set_result(WriteResult(status))
+            self._next(key)
+            return
+        self._call(READBACK[method], device).add_done_callback(lambda done: self._confirmed(key, future, status, done))
+
+    def _confirmed(self, key: tuple, future: Future, status: str, done: Future) -> None:
+        try:
+            future.set_result(WriteResult(status, done.result()))
+        except Exception:
+            # the write went through, only the confirmation is missing
+            future.set_result(WriteResult(status))
+        self._next(key)
+
+    def _call(self, method: str, *args) -> Future:
+        future = Future()
+        try:
+            if hasattr(self.tc, "submit"):
+                return self.tc.submit(method, *args)
+            # without an arbiter the call is made right away
+            future.set_result(getattr(self.tc, method)(*args))
+        except Exception as error:
+            # e.g. an unknown setter, reported through the future like an I/O error
+            future.set_exception(error)
+        return future